@@ -0,0 +1,86 @@
+# benchmark for the web-csv streaming parser; checks that parsing data in
+# chunks gives the same rows as csv.reader on the whole file for a set of
+# fixtures and chunk sizes (exiting with an error if it doesn't), then
+# reports the time to parse a large file, with and without a stray quote
+# in an unquoted field
+#
+# usage: python bench/bench_csv.py [rows]
+
+import os
+import io
+import csv
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from webcore import csvstream
+
+CHUNK_SIZE = 64*1024
+
+FIXTURES = [
+    ('plain', b'a,b\n1,2\n3,4\n'),
+    ('quoted line breaks', b'a,b\n"x\ny",2\n"q ""z""",3\n'),
+    ('crlf', b'a,b\r\n1,2\r\n"x\r\ny",3\r\n'),
+    ('cr', b'a,b\r1,2\r3,4\r'),
+    ('stray quote', b'name,height\nbob,5\'10"\nann,6\'1\nsue,"5\'2"""\n'),
+    ('no final line break', b'a,b\n1,2'),
+    ('blank lines', b'a,b\n\n1,2\n\n'),
+    ('bom', b'\xef\xbb\xbfa,b\n1,2\n'),
+    ('multibyte', 'a,b\nü,ß\n"é\nè",x\n'.encode('utf-8')),
+]
+
+def parse_chunks(content, chunk_size):
+    parser = csvstream.CsvStreamParser()
+    rows = []
+    for idx in range(0, len(content), chunk_size):
+        rows.extend(parser.feed(content[idx:idx+chunk_size]))
+    rows.extend(parser.close())
+    return rows
+
+def parse_whole(content):
+    return list(csv.reader(io.StringIO(content.decode('utf-8-sig'), newline='')))
+
+def check_fixtures():
+    # returns the number of mismatches
+    mismatches = 0
+    for name, content in FIXTURES:
+        expected = parse_whole(content)
+        failed = [size for size in (1, 2, 3, 5, 7, CHUNK_SIZE) if parse_chunks(content, size) != expected]
+        print('%-8s %s' % ('ok' if len(failed) == 0 else 'MISMATCH', name))
+        if len(failed) > 0:
+            mismatches = mismatches + 1
+            print('  chunk sizes: %r' % failed)
+            print('  expected: %r' % expected)
+            print('  streamed: %r' % parse_chunks(content, failed[0]))
+    return mismatches
+
+def make_csv(rows):
+    lines = ['id,name,value']
+    for i in range(rows):
+        name = 'name %d' % i
+        if i % 50 == 0:
+            name = '"%s, ""quoted""\nline"' % name
+        lines.append('%d,%s,%.2f' % (i, name, i*1.5))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def measure(name, content):
+    start = time.perf_counter()
+    rows = parse_chunks(content, CHUNK_SIZE)
+    elapsed = time.perf_counter() - start
+    status = 'ok' if rows == parse_whole(content) else 'MISMATCH'
+    print('%-12s %8d rows  %7.3fs  %10.0f rows/s  %s' % (name, len(rows), elapsed, len(rows)/elapsed, status))
+    return 0 if status == 'ok' else 1
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    mismatches = check_fixtures()
+    content = make_csv(rows)
+    print('csv: %d rows, %.1f MB' % (rows, len(content)/1024/1024))
+    mismatches = mismatches + measure('clean', content)
+    mismatches = mismatches + measure('stray quote', content.replace(b'name 10,', b'name 10 5\'10",', 1))
+    if mismatches > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# end-to-end benchmark for the web functions; starts the local fixture
+# server (bench/server.py), drives each function's flexio_handler through a
+# fake flex object for a set of scenarios and reports the throughput, the
+# latency percentiles and the peak memory of each scenario; each scenario
+# runs in a fresh interpreter so its peak memory and cold start are its own
+#
+# results can be saved as a baseline and later runs compared against it:
+#
+#   python bench/bench_functions.py --save bench/baseline.json
+#   python bench/bench_functions.py --compare bench/baseline.json
+#
+# usage: python bench/bench_functions.py [--runs 5] [--latency ms] [--bandwidth bytes/s]
+#            [--error-rate 0.0-1.0] [--scenario name ...] [--save path] [--compare path]
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import importlib.util
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# each scenario is a function and a function that builds its input from the
+# base url of the fixture server; the response cache and the memo are off
+# so every run does the full work
+NO_CACHE = 'cache=false&memo=false'
+
+SCENARIOS = [
+    ('csv-large', 'web-csv.py', lambda base: [base + '/csv/200000.csv', NO_CACHE]),
+    ('csv-many', 'web-csv.py', lambda base: [','.join('%s/csv/%d.csv' % (base, 2000 + i) for i in range(50)), NO_CACHE + '&schema=union']),
+    ('csv-gzip', 'web-csv.py', lambda base: [base + '/csv/200000.csv.gz', NO_CACHE]),
+    ('rss-feedparser', 'web-rss.py', lambda base: [','.join('%s/rss/%d.xml' % (base, 100 + i) for i in range(20)), '*', NO_CACHE]),
+    ('rss-fast', 'web-rss.py', lambda base: [','.join('%s/%s/%d.xml' % (base, 'rss' if i % 2 else 'atom', 100 + i) for i in range(20)), '*', NO_CACHE + '&engine=fast']),
+    ('links', 'web-extract-link.py', lambda base: [','.join('%s/links/%d.html' % (base, 2000 + i) for i in range(20)), 'show hn', '*', NO_CACHE]),
+    ('links-terms', 'web-extract-link.py', lambda base: [','.join('%s/links/%d.html' % (base, 2000 + i) for i in range(20)), ['show hn', '/story|energy/'], '*', NO_CACHE]),
+    ('newspaper', 'web-newspaper.py', lambda base: [','.join('%s/article/%d.html' % (base, i) for i in range(20)), 'title,authors,publish_date,text', NO_CACHE]),
+    ('newspaper-title', 'web-newspaper.py', lambda base: [','.join('%s/article/%d.html' % (base, i) for i in range(20)), 'title', NO_CACHE]),
+]
+
+class FlexInput:
+
+    def __init__(self, value):
+        self.value = value
+
+    def read(self):
+        return self.value
+
+class FlexOutput:
+
+    def __init__(self):
+        self.content_type = None
+        self.size = 0
+
+    def write(self, data):
+        self.size = self.size + len(data)
+
+class Flex:
+
+    def __init__(self, value):
+        self.input = FlexInput(value)
+        self.output = FlexOutput()
+
+def load_function(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_')[:-3], os.path.join(ROOT, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_peak_rss():
+    # peak resident memory in megabytes of this process and of any parse
+    # workers it started; on linux, ru_maxrss carries over the peak of the
+    # process that started this one, so the peak of this process is read
+    # from /proc where it's available; ru_maxrss is in kilobytes on linux
+    scale = 1024*1024 if sys.platform == 'darwin' else 1024
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/scale
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    usage = int(line.split()[1])/1024
+    except OSError:
+        pass
+    return usage, children
+
+def percentile(values, p):
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(p/100.0*(len(values) - 1)))))
+    return values[idx]
+
+def run_scenario(name, base, runs):
+    # runs in the scenario's own interpreter; prints the result as json
+    scenario = [s for s in SCENARIOS if s[0] == name][0]
+    value = json.dumps(scenario[2](base))
+
+    start = time.perf_counter()
+    module = load_function(scenario[1])
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    output_size = 0
+    errors = 0
+    for i in range(runs):
+        flex = Flex(value)
+        start = time.perf_counter()
+        try:
+            module.flexio_handler(flex)
+        except Exception:
+            errors = errors + 1
+        latencies.append(time.perf_counter() - start)
+        output_size = flex.output.size
+
+    rss, children_rss = get_peak_rss()
+    result = {
+        'scenario': name,
+        'runs': runs,
+        'errors': errors,
+        'load': load_time*1000,
+        'first': latencies[0]*1000,
+        'p50': percentile(latencies, 50)*1000,
+        'p90': percentile(latencies, 90)*1000,
+        'p99': percentile(latencies, 99)*1000,
+        'throughput': runs/sum(latencies),
+        'output_mb': output_size/1024/1024,
+        'rss_mb': rss,
+        'workers_rss_mb': children_rss
+    }
+    print(json.dumps(result))
+
+def print_results(results, baseline=None):
+    print('%-16s %8s %8s %8s %8s %8s %9s %8s %8s' % ('scenario', 'load ms', 'first ms', 'p50 ms', 'p90 ms', 'p99 ms', 'calls/s', 'rss MB', 'out MB'))
+    for result in results:
+        print('%-16s %8.1f %8.1f %8.1f %8.1f %8.1f %9.2f %8.1f %8.2f%s' % (
+            result['scenario'], result['load'], result['first'], result['p50'], result['p90'], result['p99'],
+            result['throughput'], result['rss_mb'], result['output_mb'],
+            '  (%d errors)' % result['errors'] if result['errors'] > 0 else ''))
+        if baseline is not None and result['scenario'] in baseline:
+            base = baseline[result['scenario']]
+            print('%-16s %8s %8s %8s %8s %8s %9s %8s' % ('  vs baseline', change(result, base, 'load'), change(result, base, 'first'),
+                change(result, base, 'p50'), change(result, base, 'p90'), change(result, base, 'p99'),
+                change(result, base, 'throughput'), change(result, base, 'rss_mb')))
+
+def change(result, base, key):
+    if not base.get(key):
+        return '-'
+    return '%+.0f%%' % ((result[key] - base[key])/base[key]*100)
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the web functions against a local fixture server')
+    parser.add_argument('--runs', type=int, default=5, help='calls per scenario')
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds before each response starts')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second for each response; 0 is unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail with a 500')
+    parser.add_argument('--scenario', action='append', help='scenarios to run (default all): ' + ', '.join(s[0] for s in SCENARIOS))
+    parser.add_argument('--save', help='save the results as a baseline')
+    parser.add_argument('--compare', help='compare the results with a saved baseline')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_scenario(args.run, args.base, args.runs)
+        return
+
+    names = args.scenario or [s[0] for s in SCENARIOS]
+    unknown = [n for n in names if n not in [s[0] for s in SCENARIOS]]
+    if len(unknown) > 0:
+        parser.error('unknown scenario: ' + ', '.join(unknown))
+
+    from server import start_server
+    base, stop = start_server(latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate)
+    results = []
+    try:
+        for name in names:
+            command = [sys.executable, os.path.abspath(__file__), '--run', name, '--base', base, '--runs', str(args.runs)]
+            output = subprocess.run(command, capture_output=True, text=True)
+            if output.returncode != 0:
+                print('%s failed:\n%s' % (name, output.stderr), file=sys.stderr)
+                continue
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    finally:
+        stop()
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'options': {'runs': args.runs, 'latency': args.latency,
+                'bandwidth': args.bandwidth, 'error_rate': args.error_rate}, 'results': {r['scenario']: r for r in results}}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# startup benchmark for the web functions; loads each function module in a
+# fresh interpreter with python -X importtime, as a cold function container
+# would, and reports the median time to load it along with the modules that
+# take the longest to import
+#
+# usage: python bench/bench_import.py [runs per function] [modules to list]
+
+import os
+import re
+import sys
+import subprocess
+import statistics
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+FUNCTIONS = ['web-csv.py', 'web-rss.py', 'web-extract-link.py', 'web-newspaper.py']
+
+LOADER = (
+    'import sys, time, importlib.util\n'
+    'sys.path.insert(0, %r)\n'
+    'start = time.perf_counter()\n'
+    'spec = importlib.util.spec_from_file_location("function", %r)\n'
+    'module = importlib.util.module_from_spec(spec)\n'
+    'spec.loader.exec_module(module)\n'
+    'print(time.perf_counter() - start)\n'
+)
+
+IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$')
+
+def load(function):
+    # returns the seconds taken to load the function and the cumulative
+    # microseconds of each top-level import made while loading it
+    code = LOADER % (ROOT, os.path.join(ROOT, function))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match is not None and len(match.group(3)) == 1:
+            imports[match.group(4)] = int(match.group(2))
+    return float(result.stdout.strip()), imports
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    # the first load of each function writes the bytecode caches, so it
+    # isn't counted
+    for function in FUNCTIONS:
+        load(function)
+
+    for function in FUNCTIONS:
+        times = []
+        imports = {}
+        for i in range(runs):
+            elapsed, run_imports = load(function)
+            times.append(elapsed)
+            for name, usec in run_imports.items():
+                imports.setdefault(name, []).append(usec)
+        print('%-20s load %7.1f ms (min %.1f, max %.1f)' % (function, statistics.median(times)*1000, min(times)*1000, max(times)*1000))
+        heaviest = sorted(((statistics.median(usecs), name) for name, usecs in imports.items()), reverse=True)
+        for usec, name in heaviest[:top]:
+            print('    %-24s %7.1f ms' % (name, usec/1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmark for the web-extract-link html parsers; checks that the fast
+# anchor scanner returns the same links as BeautifulSoup on a small corpus
+# of fixture pages (exiting with an error if it doesn't), then compares the time and peak memory of the two on a
+# large news listing page
+#
+# usage: python bench/bench_links.py [links on the listing page]
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from webcore import links
+
+PROPERTIES = ['domain', 'link', 'text']
+
+FIXTURES = [
+    ('https://example.com/news', 'show hn',
+        '<html><body><table><tr><td><a href="item?id=1">Show HN: A thing</a></td></tr>'
+        '<tr><td><a href="https://other.com/x">show  HN:\n another</a> <a href="item?id=3">Ask HN</a></td></tr></table></body></html>'),
+    ('https://example.com/a/b', 'contact',
+        '<p>Get in touch: <a href="/contact"><span>Contact</span> <b>us</b></a> &middot; <a href="mailto:x@example.com">contact by email</a></p>'),
+    ('https://example.com/a/b', 'read more',
+        '<div><a href="../c">Read &amp; more</a></div><div><a>read more without href</a></div><a href="d"><img src="x.png"> Read more</a>'),
+    ('https://example.com/', 'x',
+        '<ul><li><a href="1">x one<li><a href="2">x two</ul><p>tail x'),
+    ('https://example.com/base', 'doc',
+        '<html><head><base href="https://cdn.example.com/docs/"></head><body><a href="intro">Docs intro</a></body></html>'),
+]
+
+def make_listing(count):
+    rows = []
+    for i in range(count):
+        rows.append(
+            '<tr class="athing"><td class="title"><span class="rank">%d.</span></td><td>'
+            '<a href="https://site%d.example.com/story/%d" class="storylink">%s story number %d</a>'
+            '<span class="sitebit"> (<a href="from?site=site%d"><span>site%d.example.com</span></a>)</span></td></tr>'
+            '<tr><td class="subtext"><a href="user?id=u%d">u%d</a> | <a href="item?id=%d">%d comments</a></td></tr>'
+            % (i, i, i, 'Show HN:' if i % 10 == 0 else 'A', i, i, i, i, i, i, i)
+        )
+    return '<html><head><title>News</title></head><body><table>%s</table></body></html>' % ''.join(rows)
+
+def check_fixtures():
+    # returns the number of mismatches
+    mismatches = 0
+    for url, search, content in FIXTURES:
+        fast = links.parseContent(content, url, links.TermMatcher([search]), PROPERTIES, links.PARSER_FAST)
+        soup = links.parseContent(content, url, links.TermMatcher([search]), PROPERTIES, links.PARSER_BS4)
+        status = 'ok' if fast == soup else 'MISMATCH'
+        print('%-8s %s %r' % (status, url, search))
+        if fast != soup:
+            mismatches = mismatches + 1
+            print('  fast: %r' % fast)
+            print('  bs4:  %r' % soup)
+    return mismatches
+
+def measure(name, content, parser):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = links.parseContent(content, 'https://news.example.com/', links.TermMatcher(['show hn']), PROPERTIES, parser)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-6s %6d matches  %7.3fs  peak %7.1f MB' % (name, len(result), elapsed, peak/1024/1024))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    try:
+        import bs4
+    except ImportError:
+        bs4 = None
+    mismatches = 0
+    if bs4 is not None:
+        mismatches = check_fixtures()
+    content = make_listing(count)
+    print('listing: %d stories, %.1f MB' % (count, len(content)/1024/1024))
+    measure('fast', content, links.PARSER_FAST)
+    if bs4 is not None:
+        measure('bs4', content, links.PARSER_BS4)
+    else:
+        print('bs4    not installed')
+    if mismatches > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
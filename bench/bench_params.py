@@ -0,0 +1,130 @@
+# benchmark for the input validation of the web functions; checks that the
+# precompiled schemas give the same result as Cerberus for the parameter
+# schemas of the functions on a set of valid and invalid inputs (exiting
+# with an error if they don't), then compares the time per call of the two
+#
+# usage: python bench/bench_params.py [calls]
+
+import os
+import sys
+import time
+import importlib.util
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from webcore import params
+from webcore.params import validator_list, to_list
+
+def load_function(name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', name)
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_schemas():
+    csv = OrderedDict()
+    csv['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
+    csv['config'] = {'required': False, 'type': 'string', 'default': ''}
+
+    rss = OrderedDict()
+    rss['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
+    rss['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+    rss['config'] = {'required': False, 'type': 'string', 'default': ''}
+
+    link = OrderedDict()
+    link['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
+    link['search'] = {'required': True, 'validator': validator_list, 'coerce': load_function('web-extract-link.py').to_term_list}
+    link['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+    link['config'] = {'required': False, 'type': 'string', 'default': ''}
+
+    return [('web-csv', csv), ('web-rss', rss), ('web-extract-link', link)]
+
+VALUES = [
+    'https://a.example.com',
+    'https://a.example.com,https://b.example.com',
+    '',
+    ['https://a.example.com', 'https://b.example.com'], # split into characters, like today
+    [['https://a.example.com'], ['https://b.example.com']],
+    [['a', 'b'], ['c']],
+    [],
+    [[]],
+    ['a', ['b']],
+    [['a', 1]],
+    [1, 2],
+    [None],
+    5,
+    1.5,
+    True,
+    None,
+    {'a': 'b'},
+]
+
+CONFIGS = ['', 'limit=10&cache=false', None, 5, ['limit=1']]
+
+def get_inputs(schema):
+    # positional inputs of each length, mapped to the parameter names the
+    # way the functions do it
+    inputs = [[]]
+    names = list(schema.keys())
+    for value in VALUES:
+        inputs.append([value])
+        for other in VALUES:
+            inputs.append([value, other])
+            if len(names) > 3:
+                inputs.append([value, other, '*', 'parser=fast'])
+        for config in CONFIGS:
+            inputs.append([value] + ['*'] * (len(names) - 2) + [config])
+    inputs.append(['a'] * (len(names) + 2)) # extra values are dropped
+    return [dict(zip(names, i)) for i in inputs]
+
+def check_parity(Validator):
+    # returns the number of mismatches
+    mismatches = 0
+    count = 0
+    for name, schema in get_schemas():
+        compiled = params.Schema(schema)
+        for document in get_inputs(schema):
+            expected = Validator(schema, allow_unknown=True).validated(document)
+            result = compiled.validated(document)
+            count = count + 1
+            if expected != result:
+                mismatches = mismatches + 1
+                print('MISMATCH %s %r' % (name, document))
+                print('  cerberus: %r' % (expected,))
+                print('  compiled: %r' % (result,))
+    print('%s: %d inputs, %d mismatches' % ('ok' if mismatches == 0 else 'FAILED', count, mismatches))
+    return mismatches
+
+def measure(name, fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn()
+    elapsed = time.perf_counter() - start
+    print('%-28s %8.2f us/call' % (name, elapsed/calls*1000000))
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    try:
+        from cerberus import Validator
+    except ImportError:
+        Validator = None
+    mismatches = 0
+    if Validator is not None:
+        mismatches = check_parity(Validator)
+
+    schema = get_schemas()[2][1]
+    document = dict(zip(schema.keys(), ['https://a.example.com,https://b.example.com', 'Show HN', 'link,text', 'parser=fast']))
+    measure('compiled', lambda: params.get_schema(schema).validated(document), calls)
+    if Validator is not None:
+        validator = Validator(schema, allow_unknown=True)
+        measure('cerberus, reused validator', lambda: validator.validated(document), calls)
+        measure('cerberus, new validator', lambda: Validator(schema, allow_unknown=True).validated(document), max(calls//10, 1))
+    else:
+        print('cerberus not installed')
+    if mismatches > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
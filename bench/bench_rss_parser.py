@@ -0,0 +1,63 @@
+# benchmark for the web-rss feed parsers; compares feedparser with the fast
+# streaming parser in webcore.feeds on a large synthetic feed with
+# full-content descriptions, reporting the time and peak memory of each
+#
+# usage: python bench/bench_rss_parser.py [items] [description size]
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from webcore import feeds
+
+CHUNK_SIZE = 64*1024
+
+def make_feed(items, description_size):
+    description = ('lorem ipsum &amp; dolor sit amet ' * (description_size // 32 + 1))[:description_size]
+    parts = ['<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>Sample</title><link>https://example.com/</link>']
+    for i in range(items):
+        parts.append(
+            '<item><title>Article %d</title><link>https://example.com/%d</link><author>author@example.com</author>'
+            '<pubDate>Mon, 01 Jun 2020 10:00:00 +0200</pubDate><guid>https://example.com/%d</guid>'
+            '<description>%s</description></item>' % (i, i, i, description)
+        )
+    parts.append('</channel></rss>')
+    return ''.join(parts).encode('utf-8')
+
+def run_feedparser(content):
+    import feedparser
+    parser = feedparser.parse(content)
+    return len(parser.get('entries', []))
+
+def run_fast(content):
+    parser = feeds.FastFeedParser()
+    count = 0
+    for idx in range(0, len(content), CHUNK_SIZE):
+        count = count + len(parser.feed(content[idx:idx+CHUNK_SIZE]))
+    return count + len(parser.close())
+
+def measure(name, fn, content):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn(content)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-12s %8d items  %8.2fs  %10.0f items/s  peak %7.1f MB' % (name, count, elapsed, count/elapsed, peak/1024/1024))
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    description_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    content = make_feed(items, description_size)
+    print('feed: %d items, %.1f MB' % (items, len(content)/1024/1024))
+    try:
+        measure('feedparser', run_feedparser, content)
+    except ImportError:
+        print('feedparser    not installed')
+    measure('fast', run_fast, content)
+
+if __name__ == '__main__':
+    main()
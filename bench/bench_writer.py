@@ -0,0 +1,72 @@
+# benchmark for the web-csv/web-rss output writer; compares the previous
+# per-row approach (csv.DictReader, json.dumps and a write for each row)
+# with the positional rows and batched encoding of webcore.writer
+#
+# usage: python bench/bench_writer.py [rows] [columns]
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from webcore import writer
+
+class NullOutput:
+    def __init__(self):
+        self.size = 0
+    def write(self, data):
+        self.size = self.size + len(data)
+
+def make_csv(rows, columns):
+    fp = io.StringIO()
+    w = csv.writer(fp)
+    w.writerow(['column_%d' % c for c in range(columns)])
+    for r in range(rows):
+        w.writerow(['value %d,%d' % (r, c) for c in range(columns)])
+    return fp.getvalue()
+
+def run_per_row(content):
+    output = NullOutput()
+    reader = csv.DictReader(io.StringIO(content, newline=''))
+    properties = reader.fieldnames
+    output.write('[')
+    output.write(json.dumps(properties))
+    for row in reader:
+        output.write(',' + json.dumps([(row.get(p) or '') for p in properties]))
+    output.write(']')
+    return output.size
+
+def run_batched(content, encoder):
+    output = NullOutput()
+    reader = csv.reader(io.StringIO(content, newline=''))
+    header = next(reader)
+    index = list(range(len(header)))
+    row_writer = writer.RowWriter(output, encoder)
+    row_writer.write_row(header)
+    for row in reader:
+        row_writer.write_row([(row[i] if i < len(row) else '') for i in index])
+    row_writer.close()
+    return output.size
+
+def measure(name, rows, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    print('%-24s %10.0f rows/s  (%.2fs)' % (name, rows/elapsed, elapsed))
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    content = make_csv(rows, columns)
+    print('%d rows, %d columns' % (rows, columns))
+    measure('per-row (before)', rows, run_per_row, content)
+    measure('batched json', rows, run_batched, content, writer.ENCODER_JSON)
+    if writer.orjson is not None:
+        measure('batched orjson', rows, run_batched, content, writer.ENCODER_ORJSON)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# local stand-in for the web servers the functions download from; serves
+# synthetic csv files, rss and atom feeds, link-heavy listing pages and
+# article pages so the functions can be benchmarked without the internet
+#
+# every response can be slowed down or made to fail with the latency (ms
+# before the response starts), bandwidth (bytes per second) and error_rate
+# (fraction of 500 responses) options, set for the whole server on the
+# command line or for a single request in the query string
+#
+# paths:
+#   /csv/<rows>.csv          rows of id,name,value,date (.csv.gz gzipped)
+#   /rss/<items>.xml         rss 2.0 feed
+#   /atom/<items>.xml        atom feed
+#   /links/<count>.html      listing page with <count> story links
+#   /article/<id>.html       news article with metadata and images
+#
+# usage: python bench/server.py [--port 8080] [--latency ms] [--bandwidth bytes/s] [--error-rate 0.0-1.0]
+
+import sys
+import gzip
+import random
+import asyncio
+import argparse
+import threading
+from aiohttp import web
+
+CHUNK_SIZE = 16*1024 # bytes written at a time when limiting the bandwidth
+
+WORDS = ['data', 'function', 'sheet', 'table', 'report', 'market', 'story', 'release', 'update', 'review',
+         'energy', 'city', 'league', 'science', 'budget', 'travel', 'museum', 'harbor', 'forest', 'signal']
+
+def make_words(rnd, count):
+    return ' '.join(rnd.choice(WORDS) for i in range(count))
+
+def make_sentences(rnd, count):
+    # article text needs common words for the extractor to score it as the
+    # body of the article
+    sentences = []
+    for i in range(count):
+        sentences.append('The %s of the %s was %s and it is one of the %s that they have in this %s.' %
+            tuple(rnd.choice(WORDS) for j in range(5)))
+    return ' '.join(sentences)
+
+def make_csv(rows):
+    rnd = random.Random(rows)
+    lines = ['id,name,value,date']
+    for i in range(rows):
+        name = make_words(rnd, 3)
+        if i % 50 == 0:
+            name = '"%s, ""quoted""\n%s"' % (name, make_words(rnd, 2)) # quoted field with a newline
+        lines.append('%d,%s,%.2f,2020-%02d-%02d' % (i, name, rnd.random()*1000, i % 12 + 1, i % 28 + 1))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def make_rss(items):
+    rnd = random.Random(items)
+    entries = []
+    for i in range(items):
+        entries.append(
+            '<item><title>%s %d</title><link>http://news.example.com/%d</link><author>author%d@example.com</author>'
+            '<pubDate>Mon, %02d Jun 2020 10:%02d:00 +0000</pubDate><description>%s</description></item>'
+            % (make_words(rnd, 5).title(), i, i, i % 7, i % 28 + 1, i % 60, make_words(rnd, 40)))
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>Bench feed</title>'
+            '<link>http://news.example.com/</link>%s</channel></rss>' % ''.join(entries)).encode('utf-8')
+
+def make_atom(items):
+    rnd = random.Random(items)
+    entries = []
+    for i in range(items):
+        entries.append(
+            '<entry><title>%s %d</title><link href="http://news.example.com/%d"/><author><name>Author %d</name></author>'
+            '<updated>2020-06-%02dT10:%02d:00Z</updated><summary>%s</summary></entry>'
+            % (make_words(rnd, 5).title(), i, i, i % 7, i % 28 + 1, i % 60, make_words(rnd, 40)))
+    return ('<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom"><title>Bench feed</title>'
+            '<link href="http://news.example.com/"/>%s</feed>' % ''.join(entries)).encode('utf-8')
+
+def make_links(count):
+    rnd = random.Random(count)
+    rows = []
+    for i in range(count):
+        rows.append(
+            '<tr class="athing"><td class="title"><span class="rank">%d.</span></td><td>'
+            '<a href="https://site%d.example.com/story/%d" class="storylink">%s%s</a>'
+            '<span class="sitebit"> (<a href="from?site=site%d"><span>site%d.example.com</span></a>)</span></td></tr>'
+            '<tr><td class="subtext"><a href="user?id=u%d">u%d</a> | <a href="item?id=%d">%d comments</a></td></tr>'
+            % (i, i % 97, i, 'Show HN: ' if i % 10 == 0 else '', make_words(rnd, 6), i % 97, i % 97, i, i, i, i % 300))
+    return ('<html><head><title>News</title></head><body><table>%s</table>'
+            '<a href="?p=2" class="morelink">More</a></body></html>' % ''.join(rows)).encode('utf-8')
+
+def make_article(id):
+    rnd = random.Random(id)
+    title = make_words(rnd, 7).title()
+    paragraphs = ''.join('<p>%s</p>' % make_sentences(rnd, 5) for i in range(12))
+    return ('<html><head><title>%s</title><meta property="og:title" content="%s">'
+            '<meta name="author" content="Jane Doe"><meta property="article:published_time" content="2020-06-%02dT10:00:00Z">'
+            '<meta property="og:image" content="http://news.example.com/img/%d.jpg"></head>'
+            '<body><nav><a href="/">Home</a> <a href="/world">World</a></nav><article><h1>%s</h1>'
+            '<p class="byline">By Jane Doe</p><img src="/img/%d-1.jpg">%s<img src="/img/%d-2.jpg"></article>'
+            '<footer>Copyright</footer></body></html>'
+            % (title, title, id % 28 + 1, id, title, id, paragraphs, id)).encode('utf-8')
+
+class FixtureServer:
+
+    def __init__(self, latency=0, bandwidth=0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.bodies = {}
+        self.requests = 0
+
+    def get_body(self, kind, size):
+        # bodies are generated once and reused
+        key = (kind, size)
+        body = self.bodies.get(key)
+        if body is None:
+            if kind == 'csv':
+                body = make_csv(size)
+            elif kind == 'csv.gz':
+                body = gzip.compress(make_csv(size))
+            elif kind == 'rss':
+                body = make_rss(size)
+            elif kind == 'atom':
+                body = make_atom(size)
+            elif kind == 'links':
+                body = make_links(size)
+            else:
+                body = make_article(size)
+            self.bodies[key] = body
+        return body
+
+    async def handle(self, request):
+        self.requests = self.requests + 1
+        latency = float(request.query.get('latency', self.latency))
+        bandwidth = int(request.query.get('bandwidth', self.bandwidth))
+        error_rate = float(request.query.get('error_rate', self.error_rate))
+
+        parts = request.path.strip('/').split('/')
+        if len(parts) != 2:
+            raise web.HTTPNotFound()
+        section, name = parts
+        size, _, extension = name.partition('.')
+        kinds = {
+            ('csv', 'csv'): ('csv', 'text/csv'),
+            ('csv', 'csv.gz'): ('csv.gz', 'application/gzip'),
+            ('rss', 'xml'): ('rss', 'application/rss+xml'),
+            ('atom', 'xml'): ('atom', 'application/atom+xml'),
+            ('links', 'html'): ('links', 'text/html; charset=utf-8'),
+            ('article', 'html'): ('article', 'text/html; charset=utf-8')
+        }
+        kind = kinds.get((section, extension))
+        if kind is None or not size.isdigit():
+            raise web.HTTPNotFound()
+
+        if latency > 0:
+            await asyncio.sleep(latency/1000)
+        if error_rate > 0 and self.random.random() < error_rate:
+            return web.Response(status=500, text='error')
+
+        body = self.get_body(kind[0], int(size))
+        if bandwidth <= 0:
+            return web.Response(body=body, content_type=kind[1].split(';')[0], charset='utf-8' if 'charset' in kind[1] else None)
+
+        response = web.StreamResponse(headers={'Content-Type': kind[1]})
+        response.content_length = len(body)
+        await response.prepare(request)
+        for idx in range(0, len(body), CHUNK_SIZE):
+            chunk = body[idx:idx+CHUNK_SIZE]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk)/bandwidth)
+        await response.write_eof()
+        return response
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        return app
+
+def start_server(port=0, **options):
+    # runs the server on its own event loop in a background thread; returns
+    # the base url and a function that stops the server
+    server = FixtureServer(**options)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def start():
+        runner = web.AppRunner(server.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', port)
+        await site.start()
+        state['runner'] = runner
+        state['port'] = runner.addresses[0][1]
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start())
+        started.set()
+        loop.run_forever()
+        loop.run_until_complete(state['runner'].cleanup())
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return 'http://127.0.0.1:%d' % state['port'], stop
+
+def main():
+    parser = argparse.ArgumentParser(description='local fixture server for benchmarking the web functions')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds before each response starts')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second for each response; 0 is unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail with a 500')
+    args = parser.parse_args()
+    server = FixtureServer(args.latency, args.bandwidth, args.error_rate)
+    print('serving on http://127.0.0.1:%d' % args.port, file=sys.stderr)
+    web.run_app(server.create_app(), host='127.0.0.1', port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
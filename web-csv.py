@@ -9,111 +9,226 @@
 #   type: array
 #   description: Urls for which to get the info
 #   required: true
+# - name: config
+#   type: string
+#   description: Index-styled config string; "concurrency", "host_concurrency" and "host_rate" limit the number of simultaneous downloads overall and per host and the requests per second per host; "cache" and "cache_ttl" control the response cache, which is kept in the database at the WEBCORE_CACHE_PATH environment variable, if set; "encoder" selects the json encoder ("auto", "json" or "orjson"); "schema" sets the output columns when the urls have different columns ("first" for the columns of the first url with rows, "union" for all columns or "intersection" for the columns common to all urls); "offset" and "limit" set the rows to return, and the downloads stop once enough rows have been read; "sample" downloads only the given number of bytes from the start of each url with a range request. Files compressed with gzip, bzip2 or zip (with a single member) are decompressed as they're read; "connect_timeout" and "read_timeout" set the seconds allowed for connecting and between reads (0 for no limit); since downloads are streamed, there's no limit on the time for a whole download; "retries", "backoff" and "max_backoff" control the retries of downloads that fail with a connection error, a timeout or a 429 or 5xx status, with a random wait of up to "backoff" seconds doubling for each retry and a Retry-After header honored up to "max_backoff" seconds; "hedge" starts a second download of a url that takes longer than the given seconds, or with "auto" longer than most downloads in the call, and uses whichever finishes first; "stats" records the timings of each phase of each download (waiting for a request slot, dns, connect, first byte, download and parse), the bytes transferred, cache hits and errors, and writes them as json to "stderr", to the "log" or with "file" to the file set by the WEBCORE_STATS_PATH environment variable.
+#   required: false
 # examples:
 # - '"https://raw.githubusercontent.com/flexiodata/data/master/sample/sample-contacts.csv"'
 # notes:
 # ---
 
-import csv
-import json
-import tempfile
-import io
-import aiohttp
 import asyncio
 import itertools
-from cerberus import Validator
-from contextlib import closing
-from collections import OrderedDict
+from collections import OrderedDict, Counter
+from webcore import compression
+from webcore import csvstream
+from webcore import fetch as fetcher
+from webcore import writer
+from webcore import stats
+from webcore import warm
+from webcore.engine import open_engine
+from webcore.params import read_input, get_config, validator_list, to_list
+
+CHUNK_SIZE = 256*1024 # bytes read from a response at a time
+HEADER_CHUNK_SIZE = 16*1024 # bytes read at a time when only reading the header
+QUEUE_SIZE = 16 # batches of parsed rows buffered per url
+
+SCHEMA_FIRST = 'first'
+SCHEMA_UNION = 'union'
+SCHEMA_INTERSECTION = 'intersection'
 
 def flexio_handler(flex):
 
-    # get the input
-    input = flex.input.read()
-    input = json.loads(input)
-    if not isinstance(input, list):
-        raise ValueError
-
-    # define the expected parameters and map the values to the parameter names
-    # based on the positions of the keys/values
+    # define the expected parameters and get the input
     params = OrderedDict()
     params['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
     #params['columns'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
-    input = dict(zip(params.keys(), input))
+    params['config'] = {'required': False, 'type': 'string', 'default': ''} # index-styled config string
+    input = read_input(flex, params)
 
-    # validate the mapped input against the validator
-    v = Validator(params, allow_unknown = True)
-    input = v.validated(input)
-    if input is None:
-        raise ValueError
+    # get any configuration settings
+    config = get_config(input)
 
-    urls = input['urls']
-    loop = asyncio.get_event_loop()
-    temp_fp_all = loop.run_until_complete(fetch_all(urls))
+    schema = config.get('schema', SCHEMA_FIRST).lower().strip()
+    if schema not in (SCHEMA_FIRST, SCHEMA_UNION, SCHEMA_INTERSECTION):
+        raise ValueError
+    offset = int(config.get('offset', 0))
+    limit = config.get('limit')
+    limit = int(limit) if limit is not None else None
+    sample = config.get('sample')
+    sample = int(sample) if sample is not None else None
+    if offset < 0 or (limit is not None and limit < 0) or (sample is not None and sample <= 0):
+        raise ValueError
 
+    # stream the rows for each of the input urls to the output as the data
+    # arrives; the output is ordered by url with the columns given by the
+    # schema setting
     flex.output.content_type = 'application/json'
-    flex.output.write('[')
-
-    # get the columns for each of the input urls
-    properties = []
-    for temp_fp in temp_fp_all:
+    urls = input['urls']
+    row_writer = writer.create_writer_from_config(flex.output, config)
+
+    # record the stats for the call if they were requested
+    with stats.open_stats_from_config(config):
+        loop = warm.get_loop()
+        loop.run_until_complete(fetch_all(row_writer, urls, schema, RowRange(offset, limit), sample, config))
+        row_writer.close()
+
+class RowRange:
+
+    def __init__(self, offset=0, limit=None):
+        self.skip = offset
+        self.remaining = limit
+
+    def is_done(self):
+        return self.remaining is not None and self.remaining <= 0
+
+async def fetch_all(row_writer, urls, schema, row_range, sample, config):
+    async with open_engine(config) as web:
+
+        # with the union or intersection of the columns, the output
+        # columns are known up front from the header of each url, which
+        # is read without downloading the rest of the body
+        properties = None
+        if schema != SCHEMA_FIRST:
+            tasks = [fetch_header(web, url, sample) for url in urls]
+            headers = await asyncio.gather(*tasks)
+            properties = get_properties(headers, schema)
+            row_writer.write_row(properties)
+
+        # download a window of urls ahead of the url being written; the
+        # downloads further ahead stop reading once their queues are full,
+        # holding their request slots until they're written, so the window
+        # is kept within the number of requests the scheduler allows in
+        # flight overall and per host; that way there's always a slot for
+        # the url being written, including for its retries, which wait for
+        # a slot again
+        scheduler = web.scheduler
+        queues = [asyncio.Queue(maxsize=QUEUE_SIZE) for url in urls]
+        hosts = [fetcher.get_host(url) for url in urls]
+        window = Counter() # host -> urls in the window
+        started = 0
+        tasks = []
+
+        # once the limit is reached, the remaining downloads are
+        # cancelled when the tasks are cleaned up
         try:
-            fp = io.TextIOWrapper(temp_fp, encoding='utf-8-sig')
-            reader = csv.DictReader(fp, delimiter=',', quotechar='"')
-            for row in reader:
-                properties = list(row.keys())
-                break
+            for idx, queue in enumerate(queues):
+                if row_range.is_done():
+                    break
+                while started < len(urls) and started - idx < scheduler.concurrency and window[hosts[started]] < scheduler.host_concurrency:
+                    tasks.append(asyncio.ensure_future(fetch(web, urls[started], sample, queues[started])))
+                    window[hosts[started]] = window[hosts[started]] + 1
+                    started = started + 1
+                properties = await write_rows(row_writer, queue, properties, row_range)
+                window[hosts[idx]] = window[hosts[idx]] - 1
+            if properties is None:
+                row_writer.write_row([])
         finally:
-            fp.seek(0)
-            fp.detach()
-
-    flex.output.write(json.dumps(properties))
-
-    for temp_fp in temp_fp_all:
-       fp = io.TextIOWrapper(temp_fp, encoding='utf-8-sig')
-       reader = csv.DictReader(fp, delimiter=',', quotechar='"')
-       for row in reader:
-           row = ',' + json.dumps([(row.get(p) or '') for p in properties])
-           flex.output.write(row)
-       temp_fp.close()
-
-    flex.output.write(']')
-
-async def fetch_all(urls):
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for url in urls:
-            tasks.append(fetch(session, url))
-        temp_fp_all = await asyncio.gather(*tasks)
-        return temp_fp_all
-
-async def fetch(session, url):
-    # stream the data from the url into a temporary file and return
-    # it for processing, after which it'll be closed and deleted
-    temp_fp = tempfile.TemporaryFile()
-    async with session.get(url) as response:
-        while True:
-            data = await response.content.read(1024)
-            if not data:
-                break
-            temp_fp.write(data)
-        temp_fp.seek(0) # rewind to the beginning
-        return temp_fp
-
-def validator_list(field, value, error):
-    if isinstance(value, str):
-        return
-    if isinstance(value, list):
-        for item in value:
-            if not isinstance(item, str):
-                error(field, 'Must be a list with only string values')
-        return
-    error(field, 'Must be a string or a list of strings')
-
-def to_list(value):
-    # if we have a list of strings, create a list from them; if we have
-    # a list of lists, flatten it into a single list of strings
-    if isinstance(value, str):
-        return value.split(",")
-    if isinstance(value, list):
-        return list(itertools.chain.from_iterable(value))
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch(web, url, sample, queue):
+    # stream the rows from the url and pass them on in batches; a None marks
+    # the end of the rows and an exception is passed on to be raised by
+    # the writer
+    try:
+        batches = read_rows(web, url, CHUNK_SIZE, sample)
+        try:
+            async for rows in batches:
+                await queue.put(rows)
+        finally:
+            await batches.aclose()
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+async def fetch_header(web, url, sample):
+    # read up to the end of the first record and drop the connection
+    batches = read_rows(web, url, HEADER_CHUNK_SIZE, sample)
+    try:
+        async for rows in batches:
+            return rows[0]
+    finally:
+        await batches.aclose()
     return None
+
+async def read_rows(web, url, chunk_size, sample):
+    # download the data, decompress and parse it into rows as it arrives;
+    # with a sample size, only the start of the data is requested and the
+    # last row is dropped since it's likely to have been cut short
+    headers = None
+    if sample is not None:
+        headers = {'Range': 'bytes=0-%d' % (sample - 1)}
+    decompressor = compression.StreamDecompressor()
+    parser = csvstream.CsvStreamParser()
+    size = 0
+    chunks = web.fetch_chunks(url, chunk_size, headers)
+    try:
+        async for data in chunks:
+            size = size + len(data)
+            if sample is not None and size >= sample:
+                data = data[:len(data) - (size - sample)]
+            with stats.url_phase('parse'):
+                rows = parser.feed(decompressor.feed(data))
+            if len(rows) > 0:
+                yield rows
+            if sample is not None and size >= sample:
+                break
+    finally:
+        await chunks.aclose()
+    truncated = sample is not None and size >= sample
+    with stats.url_phase('parse'):
+        rows = parser.feed(decompressor.close()) + parser.close(truncated)
+    if len(rows) > 0:
+        yield rows
+
+def get_properties(headers, schema):
+    # union: all the columns in the order they first appear; intersection:
+    # the columns of the first url that appear in every url; urls without
+    # a header don't contribute any columns
+    headers = [list(OrderedDict.fromkeys(h)) for h in headers if h is not None]
+    if schema == SCHEMA_UNION:
+        return list(OrderedDict.fromkeys(itertools.chain.from_iterable(headers)))
+    if len(headers) == 0:
+        return []
+    common = set(headers[0]).intersection(*headers[1:])
+    return [p for p in headers[0] if p in common]
+
+async def write_rows(row_writer, queue, properties, row_range):
+    # the first row of each url is its header; the rows of each url are
+    # mapped onto the output properties by column name; if the output
+    # properties aren't known yet, they're the columns of the first url
+    # that has rows; returns once all the rows are written or the row
+    # limit is reached
+    header = None
+    index = None
+    while True:
+        if queue.empty():
+            row_writer.flush() # pass on what we have while waiting for more
+        rows = await queue.get()
+        if rows is None:
+            return properties
+        if isinstance(rows, Exception):
+            raise rows
+        for row in rows:
+            if header is None:
+                header = row
+                continue
+            if len(row) == 0:
+                continue # skip blank lines
+            if properties is None:
+                properties = list(OrderedDict.fromkeys(header))
+                row_writer.write_row(properties)
+            if row_range.skip > 0:
+                row_range.skip = row_range.skip - 1
+                continue
+            if index is None:
+                positions = {name: idx for idx, name in enumerate(header)}
+                index = [positions.get(p) for p in properties]
+            row_writer.write_row([(row[i] if i is not None and i < len(row) else '') for i in index])
+            if row_range.remaining is not None:
+                row_range.remaining = row_range.remaining - 1
+                if row_range.remaining <= 0:
+                    return properties
@@ -3,20 +3,24 @@
 # name: web-extract-link
 # deployed: true
 # title: Website Link Extraction
-# description: Returns information for all hyperlinks on one-or-more web pages matching a search string; information includes domain, link, and matching text.
+# description: Returns information for all hyperlinks on one-or-more web pages matching one-or-more search strings; information includes domain, link, matching text and the search string matched.
 # params:
 #   - name: url
 #     type: array
 #     description: Urls of web pages to search; parameter can be a single url or a comma-delimited list of urls.
 #     required: true
 #   - name: search
-#     type: string
-#     description: The search string to use to find the corresponding links.
+#     type: array
+#     description: The search string to use to find the corresponding links; parameter can be a single search string or a list of search strings. Search strings written as /pattern/ are regular expressions.
 #     required: true
 #   - name: properties
 #     type: array
 #     description: The properties to return (defaults to all properties). See "Returns" for a listing of the available properties.
 #     required: false
+#   - name: config
+#     type: string
+#     description: Index-styled config string; "concurrency", "host_concurrency" and "host_rate" limit the number of simultaneous downloads overall and per host and the requests per second per host; "cache" and "cache_ttl" control the response cache, which is kept in the database at the WEBCORE_CACHE_PATH environment variable, if set; "memo", "memo_size" and "memo_memory" (megabytes) control the memoization of extracted results, which are shared across processes through the database at the WEBCORE_MEMO_PATH environment variable, if set; "executor" selects a "process" or "thread" pool for parsing the pages and "workers" sets the size of the pool; "parser" selects the html parser ("fast" for a streaming link scanner or "bs4" for BeautifulSoup); "depth" follows the matched links to search the pages they point to, up to the given number of links away from the urls, "next" is a search string or /pattern/ for next page links to follow, "max_pages" limits the number of pages visited (default 100) and "same_domain" restricts the crawl to the domain of each url (default true); the links of each page are returned as soon as the page is done, in the order of the urls (or of the pages found by the crawl) unless "ordered" is false, and "window" sets how many pages past the next page to return can be downloaded at once with ordered output (defaults to "concurrency"); "timeout", "connect_timeout" and "read_timeout" set the seconds allowed for each download, for connecting and between reads (0 for no limit); "retries", "backoff" and "max_backoff" control the retries of downloads that fail with a connection error, a timeout or a 429 or 5xx status, with a random wait of up to "backoff" seconds doubling for each retry and a Retry-After header honored up to "max_backoff" seconds; "hedge" starts a second download of a url that takes longer than the given seconds, or with "auto" longer than most downloads in the call, and uses whichever finishes first; "stats" records the timings of each phase of each download (waiting for a request slot, dns, connect, first byte, download and parse), the bytes transferred, cache hits and errors, and writes them as json to "stderr", to the "log" or with "file" to the file set by the WEBCORE_STATS_PATH environment variable.
+#     required: false
 # returns:
 #   - name: domain
 #     type: string
@@ -27,140 +31,201 @@
 #   - name: text
 #     type: string
 #     description: The text of the matched item
+#   - name: term
+#     type: string
+#     description: The search string matched by the item; returned by default when there's more than one search string
 # examples:
 #   - '"https://www.flex.io", "Contact Us"'
 #   - '"https://news.ycombinator.com/news?p=1,https://news.ycombinator.com/news?p=2,https://news.ycombinator.com/news?p=3","Show HN"'
+#   - '"https://news.ycombinator.com/news","Show HN","*","next=More&max_pages=3"'
 # ---
 
-import json
-import aiohttp
 import asyncio
-import urllib
-import itertools
-from cerberus import Validator
 from collections import OrderedDict
-from bs4 import BeautifulSoup
+from webcore import crawl
 
-def flexio_handler(flex):
+from webcore import memo
+from webcore import links
+from webcore import stats
+from webcore import warm
+from webcore import writer
+from webcore.engine import open_engine
+from webcore.params import read_input, get_config, get_properties, validator_list, to_list
 
-    # get the input
-    input = flex.input.read()
-    try:
-        input = json.loads(input)
-        if not isinstance(input, list): raise ValueError
-    except ValueError:
-        raise ValueError
+def flexio_handler(flex):
 
-    # define the expected parameters and map the values to the parameter names
-    # based on the positions of the keys/values
+    # define the expected parameters and get the input
     params = OrderedDict()
     params['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
-    params['search'] = {'required': True, 'type': 'string'}
+    params['search'] = {'required': True, 'validator': validator_list, 'coerce': to_term_list}
     params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
-    input = dict(zip(params.keys(), input))
-
-    # validate the mapped input against the validator
-    v = Validator(params, allow_unknown = True)
-    input = v.validated(input)
-    if input is None:
-        raise ValueError
+    params['config'] = {'required': False, 'type': 'string', 'default': ''} # index-styled config string
+    input = read_input(flex, params)
 
     # get the urls to process
     search_urls = input['urls']
     search_urls = [s.strip() for s in search_urls]
 
-    # get the search term to use to find the corresponding links
-    search_text = input['search']
-    search_text = " ".join(search_text.split()).lower().strip() # remove leading/trailing/duplicate spaces and convert to lowercase
+    # get the search terms to use to find the corresponding links; the
+    # terms are compiled once for all the pages
+    matcher = links.TermMatcher(input['search'])
 
-    # get the properties to return and the property map
+    # get the properties to return and the property map; with a wildcard,
+    # the matched term is only included when there's more than one term
     property_map = OrderedDict()
     property_map['domain'] = 'domain'
     property_map['link'] = 'link'
     property_map['text'] = 'text'
-    properties = [p.lower().strip() for p in input['properties']]
-
-    # if we have a wildcard, get all the properties
-    if len(properties) == 1 and properties[0] == '*':
-        properties = list(property_map.keys())
-
-    loop = asyncio.get_event_loop()
-    result = loop.run_until_complete(fetch_all(search_urls, search_text, properties))
+    property_map['term'] = 'term'
+    wildcard = [p for p in property_map.keys() if p != 'term' or len(matcher.terms) > 1]
+    properties = get_properties(input, property_map, wildcard)
 
-    # if we don't have any results, return an empty result
-    if len(result) == 0:
-        result = [['']]
+    # get any configuration settings
+    config = get_config(input)
 
-    # return the results
-    result = json.dumps(result, default=to_string)
-    flex.output.content_type = "application/json"
-    flex.output.write(result)
+    parser = config.get('parser', links.PARSER_FAST).lower().strip()
+    if parser not in (links.PARSER_FAST, links.PARSER_BS4):
+        raise ValueError
 
-async def fetch_all(search_urls, search_text, properties):
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for search_url in search_urls:
-            tasks.append(fetch(session, search_url, search_text, properties))
-        content = await asyncio.gather(*tasks)
-        return list(itertools.chain.from_iterable(content))
+    # the rows of each page are written as soon as the page is done; with
+    # ordered output (the default), the rows are in the order of the urls
+    # and a page that's done early is held back until the pages ahead of it
+    # are written, with at most a window of pages past the next page to
+    # write started at once
+    ordered = config.get('ordered', 'true').lower() == 'true'
+    window = int(config.get('window', 0)) or None
+    if window is not None and window < 0:
+        raise ValueError
 
-async def fetch(session, search_url, search_text, properties):
+    # in crawl mode, the pages the matched links point to are searched as
+    # well, along with the pages of any next page links
+    frontier = crawl.create_frontier_from_config(config)
+    next_matcher = links.TermMatcher([config['next']]) if config.get('next') else None
+
+    # record the stats for the call if they were requested
+    with stats.open_stats_from_config(config):
+        flex.output.content_type = "application/json"
+        row_writer = writer.create_writer_from_config(flex.output, config)
+        page_writer = PageWriter(row_writer, ordered, window)
+        loop = warm.get_loop()
+        if frontier is None:
+            loop.run_until_complete(fetch_all(page_writer, search_urls, matcher, properties, parser, config))
+        else:
+            loop.run_until_complete(crawl_all(page_writer, search_urls, matcher, next_matcher, frontier, properties, parser, config))
+
+        # if we don't have any results, return an empty result
+        if row_writer.count == 0:
+            row_writer.write_row([''])
+        row_writer.close()
+
+class PageWriter:
+
+    def __init__(self, row_writer, ordered=True, window=None):
+        self.row_writer = row_writer
+        self.ordered = ordered
+        self.window = window
+        self.pending = {}
+        self.next = 0 # index of the next page to write
+
+    def can_start(self, index):
+        return not self.ordered or index < self.next + self.window
+
+    def write(self, index, rows):
+        if not self.ordered:
+            self.row_writer.write_rows(rows)
+        else:
+            self.pending[index] = rows
+            while self.next in self.pending:
+                self.row_writer.write_rows(self.pending.pop(self.next))
+                self.next = self.next + 1
+        self.row_writer.flush()
+
+async def fetch_all(page_writer, search_urls, matcher, properties, parser, config):
+    async with open_engine(config, parse=True, tasks=len(search_urls)) as web:
+        if page_writer.window is None:
+            page_writer.window = web.scheduler.concurrency
+
+        # write the rows of each page as it's done
+        tasks = {}
+        idx = 0
+        try:
+            while idx < len(search_urls) or len(tasks) > 0:
+                while idx < len(search_urls) and page_writer.can_start(idx):
+                    task = asyncio.ensure_future(fetch(web, search_urls[idx], matcher, properties, parser))
+                    tasks[task] = idx
+                    idx = idx + 1
+                done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    page_writer.write(tasks.pop(task), task.result())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch(web, search_url, matcher, properties, parser):
     try:
-        async with session.get(search_url) as response:
-            content = await response.text()
-            return parseContent(content, search_url, search_text, properties)
-    except Exception:
+        content = await web.fetch(search_url)
+        return await extract(web, content, search_url, matcher, properties, parser)
+    except Exception as e:
+        web.fail(search_url, e)
         return []
 
-def parseContent(content, search_url, search_text, properties):
-
-    # extract the info and build up the result
-    result = []
-
-    # remove leading/trailing/duplicate spaces and convert to lowercase
-    cleaned_search_text = " ".join(search_text.split()).lower().strip()
-
-    # parse the content and look for anchors
-    soup = BeautifulSoup(content, "lxml")
-    for item in soup.findAll('a'):
-
-        # get the anchor and item text
-        anchor_href = item.get('href')
-        anchor_text = item.text
+async def extract(web, content, search_url, matcher, properties, parser):
+    # parse the page off the event loop so other downloads keep going; links
+    # are resolved against the search url, so it's part of the memo key
+    key = memo.make_key(content.body, links.EXTRACTOR_VERSION, search_url, matcher.terms, properties, parser)
+    return await web.parse(key, links.parseContent, content.text(), search_url, matcher, properties, parser)
 
-        # remove leading/trailing/duplicate spaces and convert to lowercase
-        # if the cleaned search text is in the cleaned anchor text, add the item to the result
-        cleaned_anchor_text = " ".join(anchor_text.split()).lower().strip()
-        if cleaned_search_text in cleaned_anchor_text:
-            link = urllib.parse.urljoin(search_url, anchor_href)
-            domain = urllib.parse.urlparse(link)[1] # second item is the network location part of the url
-            row = [{'domain': domain, 'link': link, 'text': anchor_text}.get(p,'') for p in properties]
-            result.append(row)
-
-    return result
-
-def validator_list(field, value, error):
-    if isinstance(value, str):
-        return
-    if isinstance(value, list):
-        for item in value:
-            if not isinstance(item, str):
-                error(field, 'Must be a list with only string values')
-        return
-    error(field, 'Must be a string or a list of strings')
-
-def to_string(value):
-    if isinstance(value, (date, datetime)):
-        return value.isoformat()
-    if isinstance(value, (Decimal)):
-        return str(value)
-    return value
-
-def to_list(value):
-    # if we have a list of strings, create a list from them; if we have
-    # a list of lists, flatten it into a single list of strings
+async def crawl_all(page_writer, search_urls, matcher, next_matcher, frontier, properties, parser, config):
+    async with open_engine(config, parse=True, tasks=frontier.max_pages) as web:
+        if page_writer.window is None:
+            page_writer.window = web.scheduler.concurrency
+        for search_url in search_urls:
+            frontier.add(search_url)
+
+        # start each page as soon as it's discovered, or with ordered output,
+        # once it's within the window; the scheduler limits how many are
+        # downloaded at once; pages are ordered by when they're discovered
+        tasks = {}
+        try:
+            while len(frontier) > 0 or len(tasks) > 0:
+                while len(frontier) > 0 and page_writer.can_start(frontier.peek().index):
+                    page = frontier.pop()
+                    task = asyncio.ensure_future(crawl_page(web, page.url, matcher, next_matcher, properties, parser))
+                    tasks[task] = page
+                done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    page = tasks.pop(task)
+                    rows, matched_links, next_links = task.result()
+                    for link in next_links:
+                        frontier.add(link, page.depth, page.root)
+                    for link in matched_links:
+                        frontier.add(link, page.depth+1, page.root)
+                    page_writer.write(page.index, rows)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def crawl_page(web, search_url, matcher, next_matcher, properties, parser):
+    # a page that can't be downloaded or parsed is skipped rather than
+    # ending the crawl
+    try:
+        content = await web.fetch(search_url)
+        if content.status != 200:
+            return [], [], []
+        next_terms = next_matcher.terms if next_matcher is not None else None
+        key = memo.make_key(content.body, links.EXTRACTOR_VERSION, 'crawl', search_url, matcher.terms, next_terms, properties, parser)
+        return await web.parse(key, links.crawlContent, content.text(), search_url, matcher, properties, parser, next_matcher)
+    except Exception as e:
+        web.fail(search_url, e)
+        return [], [], []
+
+def to_term_list(value):
+    # search terms can contain commas, so a single string is a single term;
+    # a list of lists (e.g. a range of cells) is flattened
     if isinstance(value, str):
-        return value.split(",")
+        return [value]
     if isinstance(value, list):
-        return list(itertools.chain.from_iterable(value))
+        return [v for item in value for v in (item if isinstance(item, list) else [item])]
     return None
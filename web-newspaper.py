@@ -6,13 +6,17 @@
 # description: Returns content information from a web page article
 # params:
 #   - name: url
-#     type: string
-#     description: Url for the article for which to get the info
+#     type: array
+#     description: Urls for the articles for which to get the info; parameter can be a single url or a comma-delimited list of urls.
 #     required: true
 #   - name: properties
 #     type: array
 #     description: The properties to return (defaults to all properties). See "Returns" for a listing of the available properties.
 #     required: false
+#   - name: config
+#     type: string
+#     description: Index-styled config string; "concurrency", "host_concurrency" and "host_rate" limit the number of simultaneous downloads overall and per host and the requests per second per host; "cache" and "cache_ttl" control the response cache, which is kept in the database at the WEBCORE_CACHE_PATH environment variable, if set; "memo", "memo_size" and "memo_memory" (megabytes) control the memoization of extracted results, which are shared across processes through the database at the WEBCORE_MEMO_PATH environment variable, if set; "executor" selects a "process" or "thread" pool for the extraction and "workers" sets the size of the pool; "timeout", "connect_timeout" and "read_timeout" set the seconds allowed for each download, for connecting and between reads (0 for no limit); "retries", "backoff" and "max_backoff" control the retries of downloads that fail with a connection error, a timeout or a 429 or 5xx status, with a random wait of up to "backoff" seconds doubling for each retry and a Retry-After header honored up to "max_backoff" seconds; "hedge" starts a second download of a url that takes longer than the given seconds, or with "auto" longer than most downloads in the call, and uses whichever finishes first; "stats" records the timings of each phase of each download (waiting for a request slot, dns, connect, first byte, download and parse), the bytes transferred, cache hits and errors, and writes them as json to "stderr", to the "log" or with "file" to the file set by the WEBCORE_STATS_PATH environment variable.
+#     required: false
 # returns:
 #   - name: title
 #     type: string
@@ -39,40 +43,28 @@
 #   - '"https://www.flex.io"'
 #   - '"https://www.flex.io", "text"'
 #   - '"https://www.flex.io", "title, top_image"'
+#   - '"https://www.flex.io,https://www.flex.io/about", "title", "concurrency=20"'
 # ---
 
-import json
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-import itertools
-from datetime import *
-from cerberus import Validator
+import asyncio
 from collections import OrderedDict
-from newspaper import Article
+from webcore import article
 
-def flexio_handler(flex):
+from webcore import memo
+from webcore import stats
+from webcore import warm
+from webcore import writer
+from webcore.engine import open_engine
+from webcore.params import read_input, get_config, get_properties, validator_list, to_list
 
-    # get the input
-    input = flex.input.read()
-    try:
-        input = json.loads(input)
-        if not isinstance(input, list): raise ValueError
-    except ValueError:
-        raise ValueError
+def flexio_handler(flex):
 
-    # define the expected parameters and map the values to the parameter names
-    # based on the positions of the keys/values
+    # define the expected parameters and get the input
     params = OrderedDict()
-    params['url'] = {'required': True, 'type': 'string'}
+    params['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
     params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': 'title'}
-    input = dict(zip(params.keys(), input))
-
-    # validate the mapped input against the validator
-    v = Validator(params, allow_unknown = True)
-    input = v.validated(input)
-    if input is None:
-        raise ValueError
+    params['config'] = {'required': False, 'type': 'string', 'default': ''} # index-styled config string
+    input = read_input(flex, params)
 
     property_map = OrderedDict()
     property_map['title'] = 'title'
@@ -84,87 +76,52 @@ def flexio_handler(flex):
     property_map['movies'] = 'movies'
 
     # get the properties to return and the property map
-    properties = [p.lower().strip() for p in input['properties']]
-
-    # if we have a wildcard, get all the properties
-    if len(properties) == 1 and properties[0] == '*':
-        properties = list(property_map.keys())
-
-    # get the article
-    url = input['url']
-    headers = {
-        'User-Agent': 'Flex.io'
-    }
-    response = requests_retry_session().get(url, headers=headers)  # fetch the content manually; this will let us easily extend the example to make multiple async requests
-    response.encoding = response.apparent_encoding # use the apparent encoding when accessing response text
-
-    article = Article(response.url, language='en')
-    article.download(input_html=response.text)
-    article.parse()
-
-    # return the result
-    info = {}
-    info['title'] = article.title
-    info['authors'] = ','.join(article.authors)
-    info['publish_date'] = article.publish_date
-    info['text'] = article.text
-    info['top_image'] = article.top_image
-    info['images'] = ','.join(article.images)
-    info['movies'] = ','.join(article.movies)
-
-    #article.nlp()
-    #info['summary'] = article.summary
-    #info['keywords'] = ';'.joins(article.keywords)
+    properties = get_properties(input, property_map)
+
+    # get any configuration settings
+    config = get_config(input)
+
+    # get the articles; each url gets a row in the result, in the same
+    # order as the input urls
+    urls = [u.strip() for u in input['urls']]
+    fields = [property_map.get(p,'') for p in properties]
+
+    # record the stats for the call if they were requested
+    with stats.open_stats_from_config(config):
+        loop = warm.get_loop()
+        result = loop.run_until_complete(fetch_all(urls, fields, config))
+
+        # return the results
+        flex.output.content_type = "application/json"
+        row_writer = writer.create_writer_from_config(flex.output, config)
+        row_writer.write_rows(result)
+        row_writer.close()
+
+async def fetch_all(urls, fields, config):
+    # download the articles over a single session, limiting the number of
+    # simultaneous downloads, and extract the info in the parse executor so
+    # that the extraction of one article overlaps with the download of the others
+    async with open_engine(config, parse=True, initializer=article.load, tasks=len(urls)) as web:
+        tasks = []
+        for url in urls:
+            tasks.append(fetch(web, url, fields))
+        return await asyncio.gather(*tasks)
+
+async def fetch(web, url, fields):
+    try:
+        content = await web.fetch(url)
+        info = await extract(web, content, fields)
+    except Exception as e:
+        web.fail(url, e)
+        info = {}
 
     # limit the results to the requested properties
-    result = [[info.get(property_map.get(p,''),'') or '' for p in properties]]
-
-    # return the results
-    result = json.dumps(result, default=to_string)
-    flex.output.content_type = "application/json"
-    flex.output.write(result)
-
-def requests_retry_session(
-    retries=3,
-    backoff_factor=0.3,
-    status_forcelist=(429, 500, 502, 503, 504),
-    session=None,
-):
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
-
-def validator_list(field, value, error):
-    if isinstance(value, str):
-        return
-    if isinstance(value, list):
-        for item in value:
-            if not isinstance(item, str):
-                error(field, 'Must be a list with only string values')
-        return
-    error(field, 'Must be a string or a list of strings')
-
-def to_string(value):
-    if isinstance(value, (date, datetime)):
-        return value.isoformat()
-    if isinstance(value, (Decimal)):
-        return str(value)
-    return value
-
-def to_list(value):
-    # if we have a list of strings, create a list from them; if we have
-    # a list of lists, flatten it into a single list of strings
-    if isinstance(value, str):
-        return value.split(",")
-    if isinstance(value, list):
-        return list(itertools.chain.from_iterable(value))
-    return None
+    return [info.get(f,'') or '' for f in fields]
+
+async def extract(web, content, fields):
+    # the extraction depends on the url as well as the content since the
+    # url is used to resolve relative links and find dates, and on the
+    # fields since only the requested fields are extracted
+    fields = sorted(set(fields))
+    key = memo.make_key(content.body, article.EXTRACTOR_VERSION, content.url, fields)
+    return await web.parse(key, article.getArticleInfo, content.url, content.body, content.get_encoding(), fields)
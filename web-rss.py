@@ -9,6 +9,14 @@
 #   type: array
 #   description: Urls for which to get the info
 #   required: true
+# - name: properties
+#   type: array
+#   description: The properties to return (defaults to all properties). See "Returns" for a listing of the available properties.
+#   required: false
+# - name: config
+#   type: string
+#   description: Index-styled config string; "limit" sets the maximum number of articles to return, "feed_limit" sets the maximum number of articles to return from each feed, "since" only returns articles published on or after the given date/time (UTC) "headers" sets whether to include the property names as the first row, "spill_size" sets the megabytes of articles kept in memory before using disk and "engine" selects the feed parser ("feedparser", or "fast" for a streaming parser for well-formed RSS and Atom feeds that falls back to feedparser for other feeds); "timeout", "connect_timeout" and "read_timeout" set the seconds allowed for each download, for connecting and between reads (0 for no limit); with the "fast" engine, feeds are streamed and "timeout" doesn't apply; "retries", "backoff" and "max_backoff" control the retries of downloads that fail with a connection error, a timeout or a 429 or 5xx status, with a random wait of up to "backoff" seconds doubling for each retry and a Retry-After header honored up to "max_backoff" seconds; "hedge" starts a second download of a url that takes longer than the given seconds, or with "auto" longer than most downloads in the call, and uses whichever finishes first; "stats" records the timings of each phase of each download (waiting for a request slot, dns, connect, first byte, download and parse), the bytes transferred, cache hits and errors, and writes them as json to "stderr", to the "log" or with "file" to the file set by the WEBCORE_STATS_PATH environment variable.
+#   required: false
 # returns:
 # - name: channel_title
 #   type: string
@@ -38,38 +46,31 @@
 # notes:
 # ---
 
-import json
 import time
-import urllib
-import tempfile
-import aiohttp
+import datetime
 import asyncio
-import itertools
-import feedparser
-from cerberus import Validator
 from collections import OrderedDict
+from webcore import feeds
+from webcore import store
+from webcore import writer
+from webcore import stats
+from webcore import warm
+from webcore.engine import open_engine
+from webcore.params import read_input, get_config, get_properties, validator_list, to_list
 
-def flexio_handler(flex):
+ENGINE_FEEDPARSER = 'feedparser'
+ENGINE_FAST = 'fast'
 
-    # get the input
-    input = flex.input.read()
-    input = json.loads(input)
-    if not isinstance(input, list):
-        raise ValueError
+CHUNK_SIZE = 64*1024 # bytes read from a response at a time with the fast engine
 
-    # define the expected parameters and map the values to the parameter names
-    # based on the positions of the keys/values
+def flexio_handler(flex):
+
+    # define the expected parameters and get the input
     params = OrderedDict()
     params['urls'] = {'required': True, 'validator': validator_list, 'coerce': to_list}
     params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
     params['config'] = {'required': False, 'type': 'string', 'default': ''} # index-styled config string
-    input = dict(zip(params.keys(), input))
-
-    # validate the mapped input against the validator
-    v = Validator(params, allow_unknown = True)
-    input = v.validated(input)
-    if input is None:
-        raise ValueError
+    input = read_input(flex, params)
 
     # map this function's property names to the API's property names
     property_map = OrderedDict()
@@ -83,108 +84,178 @@ def flexio_handler(flex):
 
     # get the properties to return and the property map;
     # if we have a wildcard, get all the properties
-    properties = [p.lower().strip() for p in input['properties']]
-    if len(properties) == 1 and (properties[0] == '' or properties[0] == '*'):
-        properties = list(property_map.keys())
+    properties = get_properties(input, property_map)
 
     # get any configuration settings
-    config = urllib.parse.parse_qs(input['config'])
-    config = {k: v[0] for k, v in config.items()}
+    config = get_config(input)
     limit = int(config.get('limit', 10000))
+    feed_limit = int(config.get('feed_limit', limit))
+    since = config.get('since')
+    if since is not None:
+        since = string_from_datetime(since)
+    engine = config.get('engine', ENGINE_FEEDPARSER).lower().strip()
+    if engine not in (ENGINE_FEEDPARSER, ENGINE_FAST):
+        raise ValueError
     headers = config.get('headers', 'true').lower()
     if headers == 'true':
         headers = True
     else:
         headers = False
 
-    # get the feeds
+    # get the feeds; each feed stops producing articles once it has as many
+    # as can be returned
     urls = input['urls']
-    loop = asyncio.get_event_loop()
-    temp_fp_all = loop.run_until_complete(fetch_all(urls))
-
-    # write the output
-    flex.output.content_type = 'application/json'
-    flex.output.write('[')
-
-    if headers is True:
-        flex.output.write(json.dumps(properties))
-
-    idx = 0
-    for temp_fp in temp_fp_all:
-        while True:
-            row = temp_fp.readline()
-            if not row:
-                break
-            if idx >= limit:
-                break
-            row = json.loads(row)
-            content = ''
-            if headers is True or idx > 0:
-                content = ','
-            content = content + json.dumps([(row.get(p) or '') for p in properties])
-            flex.output.write(content)
-            idx = idx + 1
-
-    flex.output.write(']')
-
-async def fetch_all(urls):
+
+    # record the stats for the call if they were requested
+    with stats.open_stats_from_config(config):
+        loop = warm.get_loop()
+        row_stores = loop.run_until_complete(fetch_all(urls, properties, limit, min(limit, feed_limit), since, engine, config))
+
+        # write the output
+        flex.output.content_type = 'application/json'
+        row_writer = writer.create_writer_from_config(flex.output, config)
+
+        if headers is True:
+            row_writer.write_row(properties)
+
+        idx = 0
+        for row_store in row_stores:
+            for row in row_store:
+                if idx >= limit:
+                    break
+                row_writer.write_row(row)
+                idx = idx + 1
+            row_store.close()
+
+        row_writer.close()
+
+async def fetch_all(urls, properties, limit, feed_limit, since, engine, config):
     tasks = []
-    async with aiohttp.ClientSession(raise_for_status=True) as session:
+    budget = store.create_budget_from_config(config)
+    async with open_engine(config, raise_for_status=True) as web:
         for url in urls:
-            tasks.append(fetch(session, url))
-        temp_fp_all = await asyncio.gather(*tasks)
-        return temp_fp_all
-
-async def fetch(session, url):
-    # get the data, process it and put the results in a temporary
-    # file for aggregating with other results
-    temp_fp = tempfile.TemporaryFile(mode='w+t')
+            tasks.append(asyncio.ensure_future(fetch(web, budget, url, properties, feed_limit, since, engine)))
+
+        # collect the feeds in order until there are enough articles to
+        # reach the limit, then cancel the downloads that are left
+        row_stores = []
+        count = 0
+        try:
+            for task in tasks:
+                if count >= limit:
+                    break
+                row_store = await task
+                row_stores.append(row_store)
+                count = count + len(row_store)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results[len(row_stores):]:
+                if isinstance(result, store.RowStore):
+                    result.close()
+        return row_stores
+
+async def fetch(web, budget, url, properties, feed_limit, since, engine):
+    # get the data, process it and keep the rows for the requested properties
+    # for aggregating with other results
+    row_store = store.RowStore(budget)
+    try:
+        if feed_limit > 0 and engine == ENGINE_FAST:
+            await fetch_fast(web, row_store, url, properties, feed_limit, since)
+        elif feed_limit > 0:
+            content = await web.fetch(url)
+            with stats.url_phase('parse'):
+                content = content.text()
+                for row in getFeedItem(content, properties, since):
+                    row_store.append(row)
+                    if len(row_store) >= feed_limit:
+                        break
+    except Exception as e:
+        web.fail(url, e)
+    return row_store
+
+async def fetch_fast(web, row_store, url, properties, feed_limit, since):
+    # parse the feed as the data arrives and stop downloading once there are
+    # enough items; if the feed isn't well-formed, drop what's been parsed
+    # and parse the whole feed with feedparser
+    parser = feeds.FastFeedParser()
+    getters = getItemGetters(properties)
+    body = bytearray()
+    chunks = web.fetch_chunks(url, CHUNK_SIZE)
     try:
-        async with session.get(url) as response:
-            content = await response.text()
-            for item in getFeedItem(content):
-                data = json.dumps(item) + "\n" # application/x-ndjson
-                temp_fp.write(data)
-    except Exception:
-        pass
-    temp_fp.seek(0)
-    return temp_fp
-
-def getFeedItem(content):
-    # see: https://pythonhosted.org/feedparser/
+        try:
+            async for data in chunks:
+                body.extend(data)
+                with stats.url_phase('parse'):
+                    for channel, item in parser.feed(data):
+                        if addFeedRow(row_store, channel, item, getters, since, feed_limit):
+                            return
+            with stats.url_phase('parse'):
+                for channel, item in parser.close():
+                    if addFeedRow(row_store, channel, item, getters, since, feed_limit):
+                        return
+        except feeds.FeedParseError:
+            async for data in chunks:
+                body.extend(data)
+            row_store.clear()
+            with stats.url_phase('parse'):
+                for row in getFeedItem(bytes(body), properties, since):
+                    row_store.append(row)
+                    if len(row_store) >= feed_limit:
+                        return
+    finally:
+        await chunks.aclose()
+
+def addFeedRow(row_store, channel, item, getters, since, feed_limit):
+    # adds the row for an item if it passes the filter; returns True once
+    # the feed has as many rows as it can return
+    row = getFeedRow(channel, item, getters, since)
+    if row is not None:
+        row_store.append(row)
+    return len(row_store) >= feed_limit
+
+# the value of each property for a feed channel and item; only the requested
+# properties are extracted from the items
+ITEM_PROPERTIES = {
+    'channel_title': lambda channel, item: channel.get('title'),
+    'channel_link': lambda channel, item: channel.get('link'),
+    'item_title': lambda channel, item: item.get('title'),
+    'item_author': lambda channel, item: item.get('author'),
+    'item_link': lambda channel, item: item.get('link'),
+    'item_published': lambda channel, item: string_from_time(item.get('published_parsed')),
+    'item_description': lambda channel, item: item.get('description')
+}
+
+def getFeedItem(content, properties, since=None):
+    # see: https://pythonhosted.org/feedparser/; imported here since the
+    # fast engine only needs it for feeds it can't parse
+    import feedparser
     parser = feedparser.parse(content)
     channel = parser.get('channel',{})
     items = parser.get('entries',[])
+    getters = getItemGetters(properties)
     for i in items:
-        yield {
-            'id': i.get('id'),
-            'channel_title': channel.get('title'),
-            'channel_link': channel.get('link'),
-            'item_title': i.get('title'),
-            'item_author': i.get('author'),
-            'item_link': i.get('link'),
-            'item_published': string_from_time(i.get('published_parsed')),
-            'item_description': i.get('description')
-        }
-
-def validator_list(field, value, error):
-    if isinstance(value, str):
-        return
-    if isinstance(value, list):
-        for item in value:
-            if not isinstance(item, str):
-                error(field, 'Must be a list with only string values')
-        return
-    error(field, 'Must be a string or a list of strings')
-
-def to_list(value):
-    # if we have a list of strings, create a list from them; if we have
-    # a list of lists, flatten it into a single list of strings
-    if isinstance(value, str):
-        return value.split(",")
-    if isinstance(value, list):
-        return list(itertools.chain.from_iterable(value))
-    return None
+        row = getFeedRow(channel, i, getters, since)
+        if row is not None:
+            yield row
+
+def getItemGetters(properties):
+    return [ITEM_PROPERTIES.get(p, lambda channel, item: '') for p in properties]
+
+def getFeedRow(channel, item, getters, since):
+    if since is not None and string_from_time(item.get('published_parsed')) < since:
+        return None
+    return tuple((g(channel, item) or '') for g in getters)
+
+def string_from_datetime(value):
+    # normalize a date/time to the format used for the published date so
+    # they can be compared as strings; date/times with a time zone are
+    # converted to UTC
+    value = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S')
 
 def string_from_time(value):
     try:
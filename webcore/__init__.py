@@ -0,0 +1,2 @@
+# shared internals for the web functions (web-csv, web-extract-link,
+# web-newspaper and web-rss)
@@ -0,0 +1,74 @@
+# article extraction for web-newspaper; runs in the parse executor
+
+import importlib
+
+# bump when a change to the extraction changes its results so that
+# memoized results from the previous version aren't used
+EXTRACTOR_VERSION = '3'
+
+FIELDS = ['title', 'authors', 'publish_date', 'text', 'top_image', 'images', 'movies']
+
+# fields that need the body of the article found and analyzed, which is
+# most of the work of a full parse; the other fields come from the metadata
+# and the images of the document
+BODY_FIELDS = set(['text', 'movies'])
+
+def load():
+    # newspaper is slow to import (it pulls in nltk, PIL and lxml), so it's
+    # only imported where articles are parsed; the parse executor calls this
+    # as each worker starts so that the import overlaps with the downloads
+    importlib.import_module('newspaper')
+
+def getArticleInfo(url, body, encoding, fields=FIELDS):
+    # the page is decoded here rather than in the event loop; newspaper is
+    # given text since for bytes it runs its own detection of the encoding
+    from newspaper import Article
+    article = Article(url, language='en')
+    article.download(input_html=body.decode(encoding, errors='replace'))
+
+    # only the requested fields are extracted; a full parse is only run
+    # when a field needs the body of the article
+    if not parseHead(article, set(fields)):
+        article.parse()
+
+    info = {}
+    info['title'] = article.title
+    info['authors'] = ','.join(article.authors)
+    info['publish_date'] = article.publish_date
+    info['text'] = article.text
+    info['top_image'] = article.top_image
+    info['images'] = ','.join(article.images)
+    info['movies'] = ','.join(article.movies)
+
+    #article.nlp()
+    #info['summary'] = article.summary
+    #info['keywords'] = ';'.joins(article.keywords)
+
+    return info
+
+def parseHead(article, fields):
+    # extracts the fields that don't need the body of the article the same
+    # way a full parse does; returns False if a full parse is needed
+    if len(fields & BODY_FIELDS) > 0:
+        return False
+    doc = article.config.get_parser().fromstring(article.html)
+    if doc is None:
+        return True
+    extractor = article.extractor
+    if 'title' in fields:
+        article.set_title(extractor.get_title(doc))
+    if 'authors' in fields:
+        article.set_authors(extractor.get_authors(doc))
+    if 'publish_date' in fields:
+        article.publish_date = extractor.get_publishing_date(article.url, doc)
+    if 'top_image' in fields or 'images' in fields:
+        article.set_meta_img(extractor.get_meta_img_url(article.url, doc))
+        # without a meta image, the top image is found in the article body
+        if 'top_image' in fields and not article.has_top_image():
+            return False
+        if 'images' in fields:
+            images = extractor.get_img_urls(article.url, doc)
+            if article.meta_img:
+                images.add(article.meta_img)
+            article.set_imgs(images)
+    return True
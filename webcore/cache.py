@@ -0,0 +1,165 @@
+# persistent http response cache shared by the web functions; responses are
+# stored in a sqlite database keyed by url, served directly while they're
+# fresh according to cache-control max-age (or the configured ttl), and
+# revalidated with a conditional request (if-none-match/if-modified-since)
+# once they're stale; the least-recently-used entries are evicted when the
+# cache grows beyond its maximum size
+#
+# the cache is only used when WEBCORE_CACHE_PATH is set, and its maximum
+# size is set with WEBCORE_CACHE_SIZE; both come from the environment
+# rather than the config since the config is user input and the cache is
+# shared by every call that uses it
+
+import os
+import time
+import sqlite3
+import contextlib
+import email.utils
+
+DEFAULT_CACHE_SIZE = 256 # megabytes
+
+class CacheEntry:
+
+    __slots__ = ['url', 'response_url', 'content_type', 'body', 'etag', 'last_modified', 'expires']
+
+    def __init__(self, url, response_url, content_type, body, etag, last_modified, expires):
+        self.url = url
+        self.response_url = response_url
+        self.content_type = content_type
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def is_fresh(self):
+        return self.expires > time.time()
+
+    def get_conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class ResponseCache:
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE*1024*1024, ttl=None):
+        self.path = path
+        self.max_size = max_size
+        self.max_entry_size = max_size // 8 # keep a single response from flushing the whole cache
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        self.connection.execute('pragma journal_mode=wal')
+        self.connection.execute('pragma synchronous=normal')
+        self.connection.execute('''
+            create table if not exists responses (
+                url text primary key,
+                response_url text,
+                content_type text,
+                body blob,
+                etag text,
+                last_modified text,
+                expires real,
+                size integer,
+                accessed real
+            )''')
+        self.connection.execute('create index if not exists responses_accessed on responses (accessed)')
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, url):
+        row = self.connection.execute(
+            'select response_url, content_type, body, etag, last_modified, expires from responses where url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('update responses set accessed = ? where url = ?', (time.time(), url))
+        return CacheEntry(url, *row)
+
+    def put(self, url, response_url, status, headers, body):
+        if status != 200 or len(body) > self.max_entry_size:
+            return
+        cache_control = parse_cache_control(headers.get('Cache-Control', ''))
+        if 'no-store' in cache_control:
+            return
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        expires = self.get_expires(headers, cache_control)
+
+        # responses that are neither fresh nor revalidatable can't be reused
+        if etag is None and last_modified is None and expires <= time.time():
+            return
+
+        now = time.time()
+        self.connection.execute(
+            'insert or replace into responses values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, response_url, headers.get('Content-Type', ''), body, etag, last_modified, expires, len(body), now)
+        )
+        self.evict()
+
+    def refresh(self, entry, headers):
+        # a 304 response renews the freshness of the stored response and
+        # may carry updated validators
+        cache_control = parse_cache_control(headers.get('Cache-Control', ''))
+        entry.etag = headers.get('ETag', entry.etag)
+        entry.last_modified = headers.get('Last-Modified', entry.last_modified)
+        entry.expires = self.get_expires(headers, cache_control)
+        self.connection.execute(
+            'update responses set etag = ?, last_modified = ?, expires = ?, accessed = ? where url = ?',
+            (entry.etag, entry.last_modified, entry.expires, time.time(), entry.url)
+        )
+
+    def evict(self):
+        total = self.connection.execute('select coalesce(sum(size), 0) from responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self.connection.execute('select url, size from responses order by accessed').fetchall()
+        for url, size in rows:
+            if total <= self.max_size:
+                break
+            self.connection.execute('delete from responses where url = ?', (url,))
+            total = total - size
+
+    def get_expires(self, headers, cache_control):
+        now = time.time()
+        if self.ttl is not None:
+            return now + self.ttl
+        if 'no-cache' in cache_control:
+            return now
+        if 'max-age' in cache_control:
+            try:
+                age = int(headers.get('Age', 0))
+                return now + int(cache_control['max-age']) - age
+            except ValueError:
+                return now
+        try:
+            expires = email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+            date = email.utils.parsedate_to_datetime(headers['Date']).timestamp()
+            return now + (expires - date)
+        except (KeyError, TypeError, ValueError, IndexError):
+            return now
+
+def parse_cache_control(value):
+    directives = {}
+    for item in value.split(','):
+        name, _, argument = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+def open_cache_from_config(config):
+    # config keys: cache=true|false, cache_ttl=<seconds a response is served
+    # without revalidation, overriding the response headers>
+    path = os.environ.get('WEBCORE_CACHE_PATH', '')
+    if path == '' or config.get('cache', 'true').lower() != 'true':
+        return contextlib.nullcontext(None)
+    size = int(os.environ.get('WEBCORE_CACHE_SIZE', DEFAULT_CACHE_SIZE))*1024*1024
+    ttl = config.get('cache_ttl')
+    ttl = int(ttl) if ttl is not None else None
+    try:
+        return contextlib.closing(ResponseCache(path, size, ttl))
+    except sqlite3.Error:
+        # an unusable cache location shouldn't keep the function from running
+        return contextlib.nullcontext(None)
@@ -0,0 +1,113 @@
+# streaming decompression for downloaded files; the format is detected from
+# the leading bytes of the data (gzip, bzip2 or a zip archive, of which the
+# first member is used), and data in any other format is passed through as-is
+
+import bz2
+import zlib
+import struct
+
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
+ZIP_MAGIC = b'PK\x03\x04'
+ZIP_HEADER = struct.Struct('<4sHHHHHIIIHH') # zip local file header
+ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_BZIP2 = 12
+
+class StreamDecompressor:
+
+    def __init__(self):
+        self.buffer = b''
+        self.decompress = None
+        self.done = False
+
+    def feed(self, data):
+        if self.decompress is None:
+            self.buffer = self.buffer + data
+            if not self.detect(False):
+                return b''
+            data, self.buffer = self.buffer, b''
+        return self.decompress(data)
+
+    def close(self):
+        if self.decompress is None:
+            self.detect(True)
+            data, self.buffer = self.buffer, b''
+            return self.decompress(data)
+        return b''
+
+    def detect(self, final):
+        # returns True once enough data has been seen to pick a format
+        if len(self.buffer) < len(ZIP_MAGIC) and not final:
+            return False
+        if self.buffer.startswith(GZIP_MAGIC):
+            self.decompress = MultiStream(lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)).decompress
+        elif self.buffer.startswith(BZIP2_MAGIC):
+            self.decompress = MultiStream(bz2.BZ2Decompressor).decompress
+        elif self.buffer.startswith(ZIP_MAGIC):
+            if len(self.buffer) < ZIP_HEADER.size and not final:
+                return False
+            return self.detect_zip(final)
+        else:
+            self.decompress = passthrough
+        return True
+
+    def detect_zip(self, final):
+        _, _, flags, method, _, _, _, compressed_size, _, name_length, extra_length = ZIP_HEADER.unpack_from(self.buffer)
+        start = ZIP_HEADER.size + name_length + extra_length
+        if len(self.buffer) < start:
+            if final:
+                raise ValueError
+            return False
+        self.buffer = self.buffer[start:]
+        if method == ZIP_DEFLATED:
+            self.decompress = SingleStream(zlib.decompressobj(-zlib.MAX_WBITS)).decompress
+        elif method == ZIP_BZIP2:
+            self.decompress = SingleStream(bz2.BZ2Decompressor()).decompress
+        elif method == ZIP_STORED and not (flags & ZIP_FLAG_DATA_DESCRIPTOR):
+            self.decompress = Stored(compressed_size).decompress
+        else:
+            raise ValueError # unsupported compression method
+        return True
+
+def passthrough(data):
+    return data
+
+class MultiStream:
+    # gzip and bzip2 files can be made up of several concatenated streams
+
+    def __init__(self, create):
+        self.create = create
+        self.decompressor = create()
+
+    def decompress(self, data):
+        result = []
+        while data:
+            result.append(self.decompressor.decompress(data))
+            if not self.decompressor.eof:
+                break
+            data = self.decompressor.unused_data
+            self.decompressor = self.create()
+        return b''.join(result)
+
+class SingleStream:
+    # a zip member; anything after the end of the member is ignored
+
+    def __init__(self, decompressor):
+        self.decompressor = decompressor
+
+    def decompress(self, data):
+        if self.decompressor.eof:
+            return b''
+        return self.decompressor.decompress(data)
+
+class Stored:
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def decompress(self, data):
+        data = data[:self.remaining]
+        self.remaining = self.remaining - len(data)
+        return data
@@ -0,0 +1,89 @@
+# crawl frontier for following links across pages; pages are handed out in
+# the order they're discovered and each url is only visited once, based on
+# a normalized form of the url, up to a maximum depth and number of pages
+
+import collections
+import urllib.parse
+
+DEFAULT_MAX_PAGES = 100
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+Page = collections.namedtuple('Page', ['index', 'url', 'depth', 'root'])
+
+class Frontier:
+
+    def __init__(self, max_depth=0, max_pages=DEFAULT_MAX_PAGES, same_domain=True):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.same_domain = same_domain
+        self.seen = set()
+        self.pages = collections.deque()
+        self.count = 0
+
+    def __len__(self):
+        return len(self.pages)
+
+    def add(self, url, depth=0, root=None):
+        # queues a page to visit and returns True, or returns False if the
+        # page is out of bounds or has already been seen; root is the host
+        # of the page the crawl started from
+        if self.count >= self.max_pages or depth > self.max_depth:
+            return False
+        key = normalize_url(url)
+        if key is None or key in self.seen:
+            return False
+        host = get_domain(url)
+        if root is None:
+            root = host
+        if self.same_domain and host != root:
+            return False
+        self.seen.add(key)
+        self.pages.append(Page(self.count, url, depth, root))
+        self.count = self.count + 1
+        return True
+
+    def peek(self):
+        return self.pages[0]
+
+    def pop(self):
+        return self.pages.popleft()
+
+def normalize_url(url):
+    # returns the url with the parts that don't change the page it points
+    # to made uniform, or None if the url can't be crawled
+    try:
+        parts = urllib.parse.urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+        netloc = parts.hostname.lower()
+        if parts.port is not None and parts.port != DEFAULT_PORTS[scheme]:
+            netloc = netloc + ':' + str(parts.port)
+    except ValueError:
+        return None
+    path = parts.path or '/'
+    return urllib.parse.urlunsplit((scheme, netloc, path, parts.query, ''))
+
+def get_domain(url):
+    # host without the port and a leading www, so www.example.com and
+    # example.com are considered the same domain
+    try:
+        host = urllib.parse.urlsplit(url).hostname or ''
+    except ValueError:
+        return ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+def create_frontier_from_config(config):
+    # config keys: depth=<number of links to follow away from the given
+    # urls>, next=<search string or /pattern/ for next page links, which are
+    # followed without counting toward the depth>, max_pages=<maximum number
+    # of pages to visit>, same_domain=true|false; returns None if crawling
+    # isn't requested
+    depth = int(config.get('depth', 0))
+    if depth <= 0 and not config.get('next'):
+        return None
+    max_pages = int(config.get('max_pages', DEFAULT_MAX_PAGES))
+    same_domain = config.get('same_domain', 'true').lower() == 'true'
+    return Frontier(max(depth, 0), max_pages, same_domain)
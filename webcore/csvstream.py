@@ -0,0 +1,91 @@
+# incremental csv parsing for web-csv; data is decoded and parsed into rows
+# as it arrives rather than after the whole body has been downloaded
+
+import io
+import csv
+import codecs
+
+class NeedMoreData(Exception):
+    pass
+
+class LineFeed:
+    # line source for the csv reader; raises NeedMoreData when it runs out
+    # of lines before the data is done, and can go back to the start of the
+    # record being read so it can be read again once there's more data
+
+    def __init__(self):
+        self.lines = []
+        self.pos = 0 # next line to read
+        self.start = 0 # first line of the record being read
+        self.final = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        pos = self.pos
+        if pos == len(self.lines):
+            if self.final:
+                raise StopIteration
+            raise NeedMoreData
+        self.pos = pos + 1
+        return self.lines[pos]
+
+    def add(self, lines):
+        # drops the lines of the records that have been read
+        del self.lines[:self.start]
+        self.lines.extend(lines)
+        self.pos = 0
+        self.start = 0
+
+    def clear(self):
+        self.lines = []
+        self.pos = 0
+        self.start = 0
+
+class CsvStreamParser:
+
+    def __init__(self, encoding='utf-8-sig', delimiter=',', quotechar='"'):
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.pending = ''
+        self.feed_lines = LineFeed()
+        self.reader = csv.reader(self.feed_lines, delimiter=delimiter, quotechar=quotechar)
+
+    def feed(self, data):
+        return self.parse(self.decoder.decode(data), False)
+
+    def close(self, truncated=False):
+        # when the data was cut short, the last record may be incomplete
+        # and is dropped
+        text = self.decoder.decode(b'', True)
+        if truncated:
+            self.parse(text, False)
+            self.pending = ''
+            self.feed_lines.clear()
+            return []
+        return self.parse(text, True)
+
+    def parse(self, text, final):
+        # complete lines are handed to the csv reader, which decides where
+        # each record ends the same way it would for the whole file; a
+        # record that runs past the lines received so far is read again
+        # once more lines arrive; a trailing carriage return is held back
+        # since it may be the first half of a line break
+        buffer = self.pending + text
+        if final:
+            end = len(buffer)
+        else:
+            end = max(buffer.rfind('\n'), buffer.rfind('\r', 0, len(buffer) - 1)) + 1
+        self.pending = buffer[end:]
+        feed_lines = self.feed_lines
+        feed_lines.add(io.StringIO(buffer[:end], newline='') if end > 0 else [])
+        feed_lines.final = final
+
+        rows = []
+        try:
+            for row in self.reader:
+                rows.append(row)
+                feed_lines.start = feed_lines.pos
+        except NeedMoreData:
+            feed_lines.pos = feed_lines.start
+        return rows
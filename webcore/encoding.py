@@ -0,0 +1,92 @@
+# character encoding resolution for downloaded pages; the encoding is taken
+# from the cheapest reliable source first: a byte order mark, the charset
+# of the content type header, or a charset declared in the first few
+# kilobytes of the document (an html meta tag or an xml declaration); if
+# none of these are present, utf-8 is used if the body is valid utf-8, and
+# only then is the encoding detected statistically from a sample of the body
+
+import re
+import codecs
+
+DECLARATION_SIZE = 4096 # bytes searched for a declared charset
+DETECT_SAMPLE_SIZE = 64*1024 # bytes used for statistical detection
+DEFAULT_ENCODING = 'cp1252'
+
+# the codecs for these consume the byte order mark when decoding
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'), # before utf-16, which it starts with
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+
+DECLARATION = re.compile(rb'''<meta[^>]*?charset\s*=\s*["']?\s*([a-zA-Z0-9_:.\-]+)|<\?xml[^>]*?encoding\s*=\s*["']([a-zA-Z0-9_:.\-]+)''', re.IGNORECASE)
+
+def resolve(body, content_type=''):
+    # returns the python codec name for the body
+    encoding = get_bom_encoding(body)
+    if encoding is not None:
+        return encoding
+    encoding = get_header_encoding(content_type)
+    if encoding is not None:
+        return encoding
+    encoding = get_declared_encoding(body)
+    if encoding is not None:
+        return encoding
+    try:
+        body.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    return detect(body[:DETECT_SAMPLE_SIZE])
+
+def decode(body, content_type=''):
+    return body.decode(resolve(body, content_type), errors='replace')
+
+def get_bom_encoding(body):
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding
+    return None
+
+def get_header_encoding(content_type):
+    for item in (content_type or '').split(';')[1:]:
+        name, _, value = item.strip().partition('=')
+        if name.lower() == 'charset':
+            return lookup(value.strip('"\' '))
+    return None
+
+def get_declared_encoding(body):
+    match = DECLARATION.search(body[:DECLARATION_SIZE])
+    if match is None:
+        return None
+    encoding = lookup((match.group(1) or match.group(2)).decode('ascii'))
+    # a document that can declare its encoding in ascii isn't utf-16 or
+    # utf-32, so the declaration is for a document that was converted
+    if encoding is not None and encoding.startswith(('utf-16', 'utf-32')):
+        return 'utf-8'
+    return encoding
+
+def lookup(name):
+    # returns the python codec name for an encoding label, or None for an
+    # unknown label; latin-1 labels are treated as cp1252 like browsers do
+    try:
+        encoding = codecs.lookup(name).name
+    except LookupError:
+        return None
+    if encoding in ('latin-1', 'iso8859-1', 'ascii'):
+        return 'cp1252'
+    return encoding
+
+def detect(sample):
+    # charset_normalizer is optional (it comes with requests, which
+    # newspaper depends on) and slow to import, so it's only imported here
+    try:
+        import charset_normalizer
+    except ImportError:
+        return DEFAULT_ENCODING
+    match = charset_normalizer.from_bytes(sample).best()
+    if match is None:
+        return DEFAULT_ENCODING
+    return lookup(match.encoding) or DEFAULT_ENCODING
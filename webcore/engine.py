@@ -0,0 +1,124 @@
+# fetch engine shared by the web functions; opens everything a call needs
+# to download and parse a batch of urls (the fetch scheduler, the retry
+# policy, the response cache, the http session and, for functions that
+# parse pages, the result memo and the parse executor) from the config,
+# and closes it all when the call is done
+
+import time
+import contextlib
+from webcore import cache
+from webcore import executor
+from webcore import fetch as fetcher
+from webcore import memo
+from webcore import retry
+from webcore import stats
+
+USER_AGENT = 'Flex.io'
+
+class Engine:
+
+    def __init__(self, scheduler, policy, session, response_cache, result_memo=None, parse_executor=None, call_stats=None):
+        self.scheduler = scheduler
+        self.policy = policy
+        self.session = session
+        self.response_cache = response_cache
+        self.result_memo = result_memo
+        self.parse_executor = parse_executor
+        self.stats = call_stats
+        self.timeout = policy.create_timeout()
+
+    async def fetch(self, url):
+        # retries, timeouts and hedging are handled by the retry policy
+        request = lambda on_start: fetcher.fetch_content(self.session, self.scheduler, url, self.response_cache, on_start, self.timeout)
+        if self.stats is None:
+            return await self.policy.run(request)
+        entry = self.stats.start_url(url)
+        try:
+            content = await self.policy.run(request)
+        except Exception as e:
+            entry.fail(e)
+            raise
+        entry.succeed()
+        self.stats.finish_url(entry, len(content.body), content.status)
+        return content
+
+    def fetch_chunks(self, url, chunk_size=1024, headers=None):
+        request = lambda: fetcher.fetch_chunks(self.session, self.scheduler, url, self.response_cache, chunk_size, headers)
+        chunks = self.policy.stream(request)
+        if self.stats is None:
+            return chunks
+        return self.measure_chunks(url, chunks)
+
+    async def measure_chunks(self, url, chunks):
+        entry = self.stats.start_url(url)
+        size = 0
+        try:
+            # only the attempt that succeeds yields any of the body
+            async for data in chunks:
+                if size == 0:
+                    entry.succeed()
+                size = size + len(data)
+                yield data
+            entry.succeed()
+        except Exception as e:
+            entry.fail(e)
+            raise
+        finally:
+            await chunks.aclose()
+            self.stats.finish_url(entry, size)
+
+    async def parse(self, key, fn, *args):
+        # runs fn in the parse executor, returning the memoized result for
+        # the key instead if there is one; key is None for results that
+        # shouldn't be memoized
+        entry = stats.current_url.get() if self.stats is not None else None
+        start = time.perf_counter()
+        try:
+            if self.result_memo is None or key is None:
+                return await executor.submit(self.parse_executor, fn, *args)
+            result = self.result_memo.get(key)
+            if entry is not None:
+                entry.memo = 'hit' if result is not None else 'miss'
+            if result is None:
+                result = await executor.submit(self.parse_executor, fn, *args)
+                self.result_memo.put(key, result)
+            return result
+        except Exception as e:
+            if entry is not None:
+                entry.fail(e)
+            raise
+        finally:
+            if entry is not None:
+                entry.add_time('parse', start)
+
+    def fail(self, url, error):
+        # records an error for a url the function gave up on
+        if self.stats is not None:
+            self.stats.get_url(url).fail(error)
+
+@contextlib.asynccontextmanager
+async def open_engine(config, parse=False, initializer=None, tasks=None, **kwargs):
+    # parse=True opens the result memo and the parse executor, which is
+    # started with the given initializer and sized for the given number of
+    # parse tasks, if known; other keyword arguments are passed to the
+    # http session
+    headers = {'User-Agent': USER_AGENT}
+    headers.update(kwargs.pop('headers', {}))
+    call_stats = stats.get_current()
+    if call_stats is not None:
+        kwargs['trace_configs'] = [call_stats.create_trace_config()]
+    scheduler = fetcher.create_scheduler_from_config(config)
+    policy = retry.create_policy_from_config(config)
+    # the session timeout applies to streamed requests, which can't have a
+    # total timeout since the body is read only as fast as it's consumed;
+    # requests that read the whole body get the total timeout of their own
+    kwargs.setdefault('timeout', policy.create_timeout(total=False))
+    with contextlib.ExitStack() as stack:
+        response_cache = stack.enter_context(cache.open_cache_from_config(config))
+        result_memo = None
+        parse_executor = None
+        if parse:
+            result_memo = stack.enter_context(memo.open_memo_from_config(config))
+            parse_executor = stack.enter_context(executor.create_executor_from_config(config, initializer, tasks))
+        async with fetcher.create_session(scheduler, headers=headers, **kwargs) as session:
+            yield Engine(scheduler, policy, session, response_cache, result_memo, parse_executor, call_stats)
@@ -0,0 +1,50 @@
+# executor for the cpu-bound parsing work of the web functions; network i/o
+# stays on the event loop while the html is parsed in a process pool (or a
+# thread pool), so downloads and parsing overlap and a batch can use all
+# the cores; functions submitted to the executor must be defined at module
+# level in an importable module so they can be sent to a process pool
+
+import os
+import asyncio
+import contextlib
+from webcore import warm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+EXECUTOR_PROCESS = 'process'
+EXECUTOR_THREAD = 'thread'
+
+def create_executor(kind=EXECUTOR_PROCESS, size=None, initializer=None):
+    # initializer is called in each worker as it starts, e.g. to import the
+    # modules the submitted functions need
+    size = size or os.cpu_count() or 1
+    if kind == EXECUTOR_PROCESS:
+        try:
+            return ProcessPoolExecutor(max_workers=size, initializer=initializer)
+        except (OSError, NotImplementedError, ImportError):
+            # platforms without support for process semaphores (e.g. no
+            # /dev/shm) can't run a process pool; fall back to threads
+            pass
+    elif kind != EXECUTOR_THREAD:
+        raise ValueError
+    return ThreadPoolExecutor(max_workers=size, initializer=initializer)
+
+def create_executor_from_config(config, initializer=None, tasks=None):
+    # config keys: executor=process|thread, workers=<pool size>
+    kind = config.get('executor', EXECUTOR_PROCESS).lower().strip()
+    size = int(config.get('workers', 0)) or None
+
+    # in a warm worker, the pool is kept running for the next call instead
+    # of being shut down when the call is done
+    if warm.WARM:
+        return contextlib.nullcontext(warm.get_executor((kind, size, initializer), lambda: create_executor(kind, size, initializer)))
+
+    # otherwise the pool is only as large as the number of tasks, if known,
+    # since a process pool starts all of its workers on the first submit
+    # and a call with a single url would pay for starting a full pool
+    if tasks is not None:
+        size = max(1, min(size or os.cpu_count() or 1, tasks))
+    return create_executor(kind, size, initializer)
+
+async def submit(executor, fn, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, fn, *args)
@@ -0,0 +1,132 @@
+# fast streaming parser for well-formed rss 2.0, rss 1.0 and atom feeds;
+# items are returned as the data arrives, using the same keys as feedparser
+# entries (title, link, author, published_parsed, description, id) so the
+# results can be handled the same way; feeds that aren't well-formed xml
+# raise a FeedParseError so they can be handed to feedparser instead
+
+import time
+import datetime
+import email.utils
+import xml.etree.ElementTree as ET
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+ITEM_TAGS = ('item', 'entry')
+CHANNEL_TAGS = ('channel', 'feed')
+
+class FeedParseError(Exception):
+    pass
+
+class FastFeedParser:
+
+    def __init__(self):
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.stack = []
+        self.channel = {}
+        self.items = []
+
+    def feed(self, data):
+        try:
+            self.parser.feed(data)
+        except ET.ParseError as e:
+            raise FeedParseError(e)
+        return self.read_events()
+
+    def close(self):
+        try:
+            self.parser.close()
+        except ET.ParseError as e:
+            raise FeedParseError(e)
+        return self.read_events()
+
+    def read_events(self):
+        items = []
+        for event, elem in self.parser.read_events():
+            if event == 'start':
+                self.stack.append(elem)
+                continue
+            self.stack.pop()
+            tag = get_local_name(elem.tag)
+            parent = get_local_name(self.stack[-1].tag) if len(self.stack) > 0 else None
+            if tag in ITEM_TAGS:
+                items.append((self.channel, get_item(elem)))
+                # drop the item once it's handled so memory stays flat
+                if len(self.stack) > 0:
+                    self.stack[-1].remove(elem)
+            elif parent in CHANNEL_TAGS:
+                self.set_channel_value(tag, elem)
+        return items
+
+    def set_channel_value(self, tag, elem):
+        if tag == 'title' and 'title' not in self.channel:
+            self.channel['title'] = get_text(elem)
+        elif tag == 'link' and 'link' not in self.channel:
+            link = get_link(elem)
+            if link is not None:
+                self.channel['link'] = link
+
+def get_item(elem):
+    item = {}
+    published = None
+    for child in elem:
+        tag = child.tag
+        name = get_local_name(tag)
+        if name == 'title':
+            item['title'] = get_text(child)
+        elif name == 'link':
+            if 'link' not in item:
+                link = get_link(child)
+                if link is not None:
+                    item['link'] = link
+        elif name == 'author' or tag == DC_NS + 'creator':
+            if 'author' not in item:
+                # atom authors have a name element
+                author = child.findtext(ATOM_NS + 'name')
+                item['author'] = author if author is not None else get_text(child)
+        elif name in ('pubDate', 'published') or tag == DC_NS + 'date':
+            if published is None:
+                published = get_text(child)
+        elif name in ('description', 'summary'):
+            item['description'] = get_text(child)
+        elif name == 'content' and tag.startswith(ATOM_NS):
+            item.setdefault('description', get_text(child))
+        elif name in ('guid', 'id'):
+            item['id'] = get_text(child)
+    item['published_parsed'] = parse_date(published)
+    return item
+
+def get_link(elem):
+    # rss links are the element text; atom links are an href attribute, and
+    # only alternate links (the default) point to the content
+    href = elem.get('href')
+    if href is None:
+        return get_text(elem)
+    if elem.get('rel', 'alternate') != 'alternate':
+        return None
+    return href
+
+def get_text(elem):
+    return (elem.text or '').strip()
+
+def get_local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def parse_date(value):
+    # returns the date as a utc struct_time like feedparser's *_parsed values;
+    # rss uses rfc 822 dates and atom uses iso 8601 dates
+    if not value:
+        return None
+    try:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is not None:
+            return time.gmtime(email.utils.mktime_tz(parsed))
+    except (TypeError, ValueError, OverflowError):
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.astimezone(datetime.timezone.utc).timetuple()
+    except ValueError:
+        return None
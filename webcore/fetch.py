@@ -0,0 +1,175 @@
+# fetch scheduling for the web functions; bounds the number of requests
+# that are in flight overall and per host, and optionally spaces out the
+# requests made to the same host, so that large url lists don't open
+# thousands of sockets at once or get throttled by a single host
+
+import time
+import asyncio
+import contextlib
+import urllib.parse
+from webcore import encoding
+from webcore import retry
+from webcore import warm
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_HOST_CONCURRENCY = 6
+DEFAULT_HOST_RATE = 0 # requests per second per host; 0 is unlimited
+
+class Content:
+
+    __slots__ = ['url', 'status', 'content_type', 'body', 'from_cache', 'headers']
+
+    def __init__(self, url, status, content_type, body, from_cache=False, headers=None):
+        self.url = url
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.from_cache = from_cache
+        self.headers = headers # response headers; None for responses from the cache
+
+    def get_encoding(self):
+        return encoding.resolve(self.body, self.content_type)
+
+    def text(self):
+        return encoding.decode(self.body, self.content_type)
+
+class FetchScheduler:
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, host_concurrency=DEFAULT_HOST_CONCURRENCY, host_rate=DEFAULT_HOST_RATE):
+        if concurrency < 1 or host_concurrency < 1 or host_rate < 0:
+            raise ValueError
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.host_interval = 1.0/host_rate if host_rate > 0 else 0
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.host_semaphores = {}
+        self.host_next_start = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url):
+        # wait for a host slot first and a global slot last so that requests
+        # waiting on a busy host don't hold up requests for other hosts
+        host = get_host(url)
+        async with self.get_host_semaphore(host):
+            await self.wait_host_turn(host)
+            async with self.semaphore:
+                yield
+
+    def get_host_semaphore(self, host):
+        semaphore = self.host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_concurrency)
+            self.host_semaphores[host] = semaphore
+        return semaphore
+
+    async def wait_host_turn(self, host):
+        if self.host_interval == 0:
+            return
+        now = time.monotonic()
+        start = max(now, self.host_next_start.get(host, now))
+        self.host_next_start[host] = start + self.host_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+def create_scheduler_from_config(config):
+    # config keys: concurrency=<max requests in flight>,
+    # host_concurrency=<max requests in flight per host>,
+    # host_rate=<max requests per second per host>
+    concurrency = int(config.get('concurrency', DEFAULT_CONCURRENCY))
+    host_concurrency = int(config.get('host_concurrency', DEFAULT_HOST_CONCURRENCY))
+    host_rate = float(config.get('host_rate', DEFAULT_HOST_RATE))
+    return FetchScheduler(concurrency, host_concurrency, host_rate)
+
+def create_session(scheduler, **kwargs):
+    # aiohttp is imported here rather than at the top so that loading a
+    # function doesn't pay for it until there's something to download
+    import aiohttp
+
+    # in a warm worker, the session uses the shared connection pool and
+    # leaves it open for the next call
+    if warm.WARM:
+        return aiohttp.ClientSession(connector=warm.get_connector(), connector_owner=False, **kwargs)
+
+    # size the connection pool to match the scheduler limits so that idle
+    # keep-alive connections are reused rather than opening new ones
+    connector = aiohttp.TCPConnector(limit=scheduler.concurrency, limit_per_host=scheduler.host_concurrency)
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+async def fetch_content(session, scheduler, url, cache=None, on_start=None, timeout=None):
+    # get the content for a url, using the response cache if one is given;
+    # fresh responses are returned from the cache without a request and
+    # stale responses are revalidated with a conditional request; on_start
+    # is called once the request has a slot; timeout replaces the timeout
+    # of the session for the request
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and entry.is_fresh():
+        return Content(entry.response_url, 200, entry.content_type, entry.body, True)
+
+    headers = entry.get_conditional_headers() if entry is not None else None
+    async with scheduler.slot(url):
+        if on_start is not None:
+            on_start()
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        async with session.get(url, headers=headers, **kwargs) as response:
+            if entry is not None and response.status == 304:
+                cache.refresh(entry, response.headers)
+                return Content(entry.response_url, 200, entry.content_type, entry.body, True)
+            body = await response.read()
+
+    content = Content(str(response.url), response.status, response.headers.get('Content-Type', ''), body, headers=response.headers)
+    if cache is not None:
+        cache.put(url, content.url, response.status, response.headers, body)
+    return content
+
+async def fetch_chunks(session, scheduler, url, cache=None, chunk_size=1024, headers=None):
+    # same as fetch_content(), but yields the body in chunks as it arrives;
+    # responses that are too large for the cache are streamed without
+    # being kept in memory
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and entry.is_fresh():
+        yield entry.body
+        return
+
+    headers = dict(headers or {})
+    if entry is not None:
+        headers.update(entry.get_conditional_headers())
+    async with scheduler.slot(url):
+        async with session.get(url, headers=headers) as response:
+            if entry is not None and response.status == 304:
+                cache.refresh(entry, response.headers)
+                yield entry.body
+                return
+
+            # a status worth retrying is raised before any of the body is
+            # yielded so that the retry policy can retry the request
+            if response.status in retry.RETRY_STATUSES:
+                response.raise_for_status()
+
+            # only responses that say they're small enough for the cache are
+            # kept while they're streamed, so that many large downloads at
+            # once don't each hold a buffer the size of the cache limit
+            buffer = None
+            if cache is not None and response.status == 200 and is_cacheable_size(response, cache.max_entry_size):
+                buffer = bytearray()
+            while True:
+                data = await response.content.read(chunk_size)
+                if not data:
+                    break
+                if buffer is not None:
+                    buffer.extend(data)
+                    if len(buffer) > cache.max_entry_size:
+                        buffer = None
+                yield data
+
+            if buffer is not None:
+                cache.put(url, str(response.url), response.status, response.headers, bytes(buffer))
+
+def is_cacheable_size(response, max_size):
+    length = response.headers.get('Content-Length', '')
+    return length.isdigit() and int(length) <= max_size
+
+def get_host(url):
+    try:
+        return urllib.parse.urlsplit(url).netloc.lower()
+    except ValueError:
+        return ''
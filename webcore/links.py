@@ -0,0 +1,205 @@
+# link extraction for web-extract-link; runs in the parse executor
+
+import re
+import urllib.parse
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# bump when a change to the extraction changes its results so that
+# memoized results from the previous version aren't used
+EXTRACTOR_VERSION = '5'
+
+PARSER_FAST = 'fast'
+PARSER_BS4 = 'bs4'
+
+# elements without an end tag
+VOID_ELEMENTS = set(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr'])
+
+class TermMatcher:
+    # matches anchor text against a list of search terms; plain terms match
+    # anywhere in the text ignoring case and extra spaces, and terms written
+    # as /pattern/ are regular expressions matched against the text with its
+    # spaces normalized, also ignoring case; the plain terms are also
+    # compiled into a single expression that rules out most anchors in one
+    # pass, while the regular expressions are only ever compiled on their
+    # own since combining them would renumber their groups and could clash
+    # on group names and inline flags
+
+    def __init__(self, terms):
+        self.terms = []
+        self.patterns = []
+        plain_patterns = []
+        for term in terms:
+            term = term.strip()
+            if term in self.terms:
+                continue
+            pattern, is_regex = get_term_pattern(term)
+            self.terms.append(term)
+            self.patterns.append((re.compile(pattern, re.IGNORECASE), is_regex))
+            if not is_regex:
+                plain_patterns.append(pattern)
+        if len(self.terms) == 0:
+            raise ValueError
+        self.plain_pattern = None
+        if len(plain_patterns) > 1:
+            self.plain_pattern = re.compile('|'.join(plain_patterns), re.IGNORECASE)
+
+    def match(self, text):
+        # returns the terms that match the text
+        cleaned_text = " ".join(text.split())
+        if len(self.terms) == 1:
+            return self.terms if self.patterns[0][0].search(cleaned_text) is not None else []
+        check_plain = self.plain_pattern is None or self.plain_pattern.search(cleaned_text) is not None
+        return [t for t, (p, is_regex) in zip(self.terms, self.patterns) if (is_regex or check_plain) and p.search(cleaned_text) is not None]
+
+def get_term_pattern(term):
+    # returns the pattern for a term and whether the term is a regular
+    # expression
+    if len(term) > 2 and term.startswith('/') and term.endswith('/'):
+        try:
+            pattern = term[1:-1]
+            re.compile(pattern, re.IGNORECASE)
+            return pattern, True
+        except re.error:
+            raise ValueError
+    # remove leading/trailing/duplicate spaces
+    return re.escape(" ".join(term.split())), False
+
+class AnchorTarget:
+    # parser target for the lxml html parser that collects the href and
+    # text of each anchor and the document base url from the parser events
+    # without building a tree; the events follow the same implied structure
+    # as the tree that BeautifulSoup builds with lxml
+
+    def __init__(self):
+        self.base = None
+        self.anchors = []
+        self.open = []
+
+    def start(self, tag, attrib):
+        if tag == 'a':
+            anchor = [attrib.get('href'), []]
+            self.anchors.append(anchor)
+            self.open.append(anchor)
+        elif tag == 'base' and self.base is None:
+            self.base = attrib.get('href')
+
+    def end(self, tag):
+        if tag == 'a' and len(self.open) > 0:
+            self.open.pop()
+
+    def data(self, data):
+        for anchor in self.open:
+            anchor[1].append(data)
+
+    def close(self):
+        return self.base, [(href, ''.join(text)) for href, text in self.anchors]
+
+class AnchorScanner(HTMLParser):
+    # same as AnchorTarget for when lxml isn't available, using the events
+    # of the standard library html parser; like the lxml html parser, an
+    # anchor is closed by the start of another anchor or by the end of an
+    # element that contains it
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.anchors = []
+        self.anchor = None
+        self.anchor_depth = 0
+        self.tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.close_anchor()
+            self.anchor = [get_attr(attrs, 'href'), []]
+            self.anchors.append(self.anchor)
+            self.anchor_depth = len(self.tags)
+        elif tag == 'base' and self.base is None:
+            self.base = get_attr(attrs, 'href')
+        if tag not in VOID_ELEMENTS:
+            self.tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.tags:
+            return # stray end tag
+        while self.tags.pop() != tag:
+            pass
+        if self.anchor is not None and len(self.tags) <= self.anchor_depth:
+            self.close_anchor()
+
+    def handle_data(self, data):
+        if self.anchor is not None:
+            self.anchor[1].append(data)
+
+    def close_anchor(self):
+        self.anchor = None
+
+def get_attr(attrs, name):
+    for key, value in attrs:
+        if key == name:
+            return value
+    return None
+
+def getAnchors(content, parser=PARSER_FAST):
+    # returns the base url of the document, if any, and the href and text
+    # of each anchor in document order
+    if parser == PARSER_BS4:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(content, "lxml")
+        base = soup.find('base', href=True)
+        base = base.get('href') if base is not None else None
+        return base, [(item.get('href'), item.text) for item in soup.findAll('a')]
+    if etree is not None:
+        parser = etree.HTMLParser(target=AnchorTarget(), recover=True)
+        parser.feed(content)
+        return parser.close()
+    scanner = AnchorScanner()
+    scanner.feed(content)
+    scanner.close()
+    return scanner.base, [(href, ''.join(text)) for href, text in scanner.anchors]
+
+def parseContent(content, search_url, matcher, properties, parser=PARSER_FAST):
+    result, _, _ = crawlContent(content, search_url, matcher, properties, parser)
+    return result
+
+def crawlContent(content, search_url, matcher, properties, parser=PARSER_FAST, next_matcher=None):
+
+    # same as parseContent, but also returns the links of the matched anchors
+    # and the links of the anchors matching the next page matcher, if any,
+    # so the pages they point to can be crawled
+    result = []
+    matched_links = []
+    next_links = []
+
+    # parse the content and look for anchors; links are relative to the
+    # document base url if there is one
+    base, anchors = getAnchors(content, parser)
+    if base:
+        search_url = urllib.parse.urljoin(search_url, base)
+    for anchor_href, anchor_text in anchors:
+        if anchor_href and next_matcher is not None and len(next_matcher.match(anchor_text)) > 0:
+            next_links.append(urllib.parse.urljoin(search_url, anchor_href))
+
+        # add a row to the result for each search term the anchor text matches
+        terms = matcher.match(anchor_text)
+        if len(terms) == 0:
+            continue
+        link = urllib.parse.urljoin(search_url, anchor_href)
+        domain = urllib.parse.urlparse(link)[1] # second item is the network location part of the url
+        if anchor_href:
+            matched_links.append(link)
+        for term in terms:
+            row = [{'domain': domain, 'link': link, 'text': anchor_text, 'term': term}.get(p,'') for p in properties]
+            result.append(row)
+
+    return result, matched_links, next_links
@@ -0,0 +1,176 @@
+# memoization of extracted results for the web functions; results are keyed
+# by a hash of the content they were extracted from, the version of the
+# extractor and any other inputs to the extraction, so repeated lookups of
+# unchanged pages skip parsing entirely; results are kept in an in-process
+# lru, bounded by both the number of entries and their approximate size,
+# that lives for the life of the process and can optionally be backed by a
+# sqlite database so they're shared across processes
+#
+# the database is only used when WEBCORE_MEMO_PATH is set; the location
+# comes from the environment rather than the config since the config is
+# user input, and results are stored as json rather than pickled so that
+# reading the database can't run code
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import datetime
+import contextlib
+from collections import OrderedDict
+
+DEFAULT_MEMO_SIZE = 1024 # entries kept in memory
+DEFAULT_MEMO_MEMORY = 64 # megabytes of entries kept in memory
+PERSISTENT_SIZE_FACTOR = 64 # entries kept on disk per entry kept in memory
+
+class ResultMemo:
+
+    def __init__(self, max_entries=DEFAULT_MEMO_SIZE, max_bytes=DEFAULT_MEMO_MEMORY*1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (value, size)
+        self.size = 0
+        self.connection = None
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        if self.connection is None:
+            return None
+        row = self.connection.execute('select value from results where key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            value = load_value(row[0])
+        except ValueError:
+            return None # not stored as json, e.g. by an older version
+        self.connection.execute('update results set accessed = ? where key = ?', (time.time(), key))
+        self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self.remember(key, value)
+        if self.connection is None:
+            return
+        try:
+            data = dump_value(value)
+        except (TypeError, ValueError):
+            return # only kept in memory
+        self.connection.execute(
+            'insert or replace into results values (?, ?, ?)',
+            (key, data, time.time())
+        )
+        self.evict_persistent()
+
+    def remember(self, key, value):
+        # results larger than the memory limit aren't kept in memory
+        self.forget(key)
+        size = get_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.size = self.size + size
+        self.evict()
+
+    def forget(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size = self.size - entry[1]
+
+    def resize(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, (value, size) = self.entries.popitem(last=False)
+            self.size = self.size - size
+
+    def attach(self, path):
+        self.connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        self.connection.execute('pragma journal_mode=wal')
+        self.connection.execute('pragma synchronous=normal')
+        self.connection.execute('create table if not exists results (key text primary key, value text, accessed real)')
+        self.connection.execute('create index if not exists results_accessed on results (accessed)')
+
+    def detach(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def evict_persistent(self):
+        limit = self.max_entries*PERSISTENT_SIZE_FACTOR
+        count = self.connection.execute('select count(*) from results').fetchone()[0]
+        if count <= limit:
+            return
+        self.connection.execute(
+            'delete from results where key in (select key from results order by accessed limit ?)',
+            (count - limit,)
+        )
+
+# results are memoized for the life of the process
+MEMO = ResultMemo()
+
+def get_size(value):
+    # rough size of a result made of lists, tuples and dicts of strings and
+    # other scalars; good enough for bounding the memory of the memo
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size = size + sum(get_size(k) + get_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size = size + sum(get_size(v) for v in value)
+    return size
+
+def dump_value(value):
+    return json.dumps(value, default=encode_date)
+
+def load_value(data):
+    return json.loads(data, object_hook=decode_date)
+
+def encode_date(value):
+    # newspaper gives the publish date as a datetime
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError
+
+def decode_date(value):
+    if len(value) == 1 and '$datetime' in value:
+        return datetime.datetime.fromisoformat(value['$datetime'])
+    return value
+
+def make_key(content, version, *parts):
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='surrogatepass')
+    digest = hashlib.sha1(content)
+    digest.update(('\0' + version).encode('utf-8'))
+    for part in parts:
+        digest.update(('\0' + repr(part)).encode('utf-8'))
+    return digest.hexdigest()
+
+@contextlib.contextmanager
+def open_memo_from_config(config):
+    # config keys: memo=true|false, memo_size=<entries kept in memory>,
+    # memo_memory=<megabytes of entries kept in memory>; results are shared
+    # across processes through the database at WEBCORE_MEMO_PATH, if set
+    if config.get('memo', 'true').lower() != 'true':
+        yield None
+        return
+    MEMO.resize(int(config.get('memo_size', DEFAULT_MEMO_SIZE)), int(config.get('memo_memory', DEFAULT_MEMO_MEMORY))*1024*1024)
+    path = os.environ.get('WEBCORE_MEMO_PATH', '')
+    if path == '':
+        yield MEMO
+        return
+    try:
+        MEMO.attach(path)
+    except sqlite3.Error:
+        # an unusable memo location shouldn't keep the function from running
+        MEMO.detach()
+    try:
+        yield MEMO
+    finally:
+        MEMO.detach()
@@ -0,0 +1,137 @@
+# input handling shared by the web functions; the input is a json array of
+# positional values that are mapped to the parameter names in order,
+# validated, and coerced into lists, and the config parameter is an
+# index-styled string of settings
+
+import json
+import itertools
+import urllib.parse
+
+MAX_SCHEMAS = 64
+
+TYPES = {
+    'string': str
+}
+
+RULES = set(['required', 'default', 'nullable', 'type', 'coerce', 'validator'])
+
+schemas = {}
+
+class Schema:
+    # precompiled validator for the flat parameter schemas of the web
+    # functions; supports the Cerberus rules they use (required, default,
+    # nullable, type, coerce and validator) and gives the same result as
+    # Cerberus with allow_unknown: defaults are set for missing and null
+    # values, values are coerced, and the document is invalid if a coerce
+    # function raises, a required value is missing, a value is null, a
+    # value has the wrong type or a validator reports an error
+
+    def __init__(self, params):
+        self.fields = []
+        for name, rules in params.items():
+            if not RULES.issuperset(rules.keys()) or rules.get('type', 'string') not in TYPES:
+                raise ValueError
+            self.fields.append((
+                name,
+                rules.get('required', False),
+                'default' in rules,
+                rules.get('default'),
+                rules.get('nullable', False),
+                TYPES.get(rules.get('type')),
+                rules.get('coerce'),
+                rules.get('validator')
+            ))
+
+    def validated(self, document):
+        # returns the normalized document, or None if it isn't valid
+        document = dict(document)
+        errors = []
+        def error(field, message):
+            errors.append((field, message))
+        for name, required, has_default, default, nullable, type, coerce, validator in self.fields:
+            if has_default and (name not in document or (document[name] is None and not nullable)):
+                document[name] = default
+            if name not in document:
+                if required:
+                    return None
+                continue
+            value = document[name]
+            if coerce is not None:
+                try:
+                    value = coerce(value)
+                except Exception:
+                    if not (nullable and value is None):
+                        return None
+                document[name] = value
+            if value is None:
+                if nullable:
+                    continue
+                return None
+            if type is not None and not isinstance(value, type):
+                return None
+            if validator is not None:
+                validator(name, value, error)
+                if len(errors) > 0:
+                    return None
+        return document
+
+def get_schema(params):
+    # schemas are compiled once and reused; they're looked up by their
+    # rules, which refer to module-level validator and coerce functions
+    key = tuple((name, tuple(rules.items())) for name, rules in params.items())
+    schema = schemas.get(key)
+    if schema is None:
+        if len(schemas) >= MAX_SCHEMAS:
+            schemas.clear() # functions reloaded into new modules
+        schema = Schema(params)
+        schemas[key] = schema
+    return schema
+
+def read_input(flex, params):
+    # define the expected parameters and map the values to the parameter names
+    # based on the positions of the keys/values
+    input = flex.input.read()
+    try:
+        input = json.loads(input)
+        if not isinstance(input, list): raise ValueError
+    except ValueError:
+        raise ValueError
+    input = dict(zip(params.keys(), input))
+
+    # validate the mapped input against the validator
+    input = get_schema(params).validated(input)
+    if input is None:
+        raise ValueError
+    return input
+
+def get_config(input):
+    # get any configuration settings
+    config = urllib.parse.parse_qs(input.get('config', ''))
+    return {k: v[0] for k, v in config.items()}
+
+def get_properties(input, property_map, wildcard=None):
+    # get the properties to return; if we have a wildcard, get the wildcard
+    # properties, which default to all the properties in the property map
+    properties = [p.lower().strip() for p in input['properties']]
+    if len(properties) == 1 and (properties[0] == '' or properties[0] == '*'):
+        properties = list(wildcard if wildcard is not None else property_map.keys())
+    return properties
+
+def validator_list(field, value, error):
+    if isinstance(value, str):
+        return
+    if isinstance(value, list):
+        for item in value:
+            if not isinstance(item, str):
+                error(field, 'Must be a list with only string values')
+        return
+    error(field, 'Must be a string or a list of strings')
+
+def to_list(value):
+    # if we have a list of strings, create a list from them; if we have
+    # a list of lists, flatten it into a single list of strings
+    if isinstance(value, str):
+        return value.split(",")
+    if isinstance(value, list):
+        return list(itertools.chain.from_iterable(value))
+    return None
@@ -0,0 +1,218 @@
+# retry, timeout and hedging policy for the requests of the web functions;
+# each request is bounded by connect and read timeouts, and a request whose
+# whole body is read at once by a total timeout as well (a streamed body is
+# read as the caller consumes it, so it can take any time); requests that
+# fail with a connection error, a timeout or a 429 or 5xx status are retried
+# with exponential backoff and jitter (waiting as long as a Retry-After
+# header asks, up to a limit), and a slow request can be hedged by starting
+# a duplicate of it and using whichever response arrives first, so that a
+# single hung or overloaded server can't hold up a whole call
+
+import time
+import random
+import asyncio
+import collections
+import email.utils
+
+DEFAULT_TIMEOUT = 120 # seconds for a request, including reading the body, unless streamed; 0 is unlimited
+DEFAULT_CONNECT_TIMEOUT = 10 # seconds to connect to the server; 0 is unlimited
+DEFAULT_READ_TIMEOUT = 30 # seconds between reads from the server; 0 is unlimited
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3 # seconds before the first retry, doubling for each retry
+DEFAULT_MAX_BACKOFF = 10 # longest wait before a retry, including a Retry-After wait
+DEFAULT_HEDGE = 0 # seconds before a duplicate request is started; 0 is off
+
+HEDGE_AUTO = 'auto'
+HEDGE_PERCENTILE = 95 # with hedge=auto, requests slower than this percentile are hedged
+HEDGE_MIN_SAMPLES = 10 # requests timed before hedge=auto starts hedging
+LATENCY_WINDOW = 200 # most recent requests used for the hedge=auto percentile
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class RetryPolicy:
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF, hedge=DEFAULT_HEDGE,
+                 timeout=DEFAULT_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+        # hedge is the seconds before a duplicate request is started or
+        # HEDGE_AUTO to hedge the requests that are slower than most
+        if retries < 0 or backoff < 0 or max_backoff < 0 or timeout < 0 or connect_timeout < 0 or read_timeout < 0:
+            raise ValueError
+        if hedge != HEDGE_AUTO and hedge < 0:
+            raise ValueError
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def create_timeout(self, total=True):
+        # total=False leaves out the total timeout, for streamed requests
+        import aiohttp
+        return aiohttp.ClientTimeout(total=(self.timeout or None) if total else None, sock_connect=self.connect_timeout or None, sock_read=self.read_timeout or None)
+
+    async def run(self, request):
+        # request is a function that returns the awaitable for a new attempt
+        # at the request, given a function to call once the attempt has a
+        # request slot (or None); returns the content of the first attempt that
+        # doesn't need to be retried, or of the last attempt
+        attempt = 0
+        while True:
+            try:
+                content = await self.run_hedged(request)
+            except Exception as e:
+                delay = self.get_error_delay(attempt, e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.get_status_delay(attempt, content.status, content.headers)
+                if delay is None:
+                    return content
+            await asyncio.sleep(delay)
+            attempt = attempt + 1
+
+    async def stream(self, request):
+        # same as run(), but for a request that yields the body in chunks;
+        # the request is only retried if it fails before any of the body is
+        # yielded, and isn't hedged
+        attempt = 0
+        while True:
+            chunks = request()
+            started = False
+            try:
+                async for data in chunks:
+                    started = True
+                    yield data
+                return
+            except Exception as e:
+                delay = self.get_error_delay(attempt, e) if not started else None
+                if delay is None:
+                    raise
+            finally:
+                await chunks.aclose()
+            await asyncio.sleep(delay)
+            attempt = attempt + 1
+
+    async def run_hedged(self, request):
+        if self.hedge == 0:
+            return await request(None)
+        attempt = Attempt()
+        first = asyncio.ensure_future(self.run_timed(request, attempt))
+        started = asyncio.ensure_future(attempt.started.wait())
+        pending = set([first, started])
+        try:
+            # the hedge delay counts from when the request gets a request
+            # slot, so that requests waiting for a slot aren't duplicated
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+            pending = set([first])
+            delay = self.get_hedge_delay()
+            if first.done() or delay is None:
+                return await first
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if len(done) > 0:
+                return first.result()
+
+            # the request is slow; start a duplicate and use whichever of the
+            # two succeeds first, cancelling the other
+            pending.add(asyncio.ensure_future(self.run_timed(request, Attempt())))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if len(succeeded) > 0:
+                    return succeeded[0].result()
+                if len(pending) == 0:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run_timed(self, request, attempt):
+        # keeps the time of the requests that reach the server for hedge=auto
+        content = await request(attempt.start)
+        if self.hedge == HEDGE_AUTO and attempt.start_time is not None and not content.from_cache:
+            self.latencies.append(time.perf_counter() - attempt.start_time)
+        return content
+
+    def get_hedge_delay(self):
+        if self.hedge == HEDGE_AUTO:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+            return latencies[min(len(latencies) - 1, len(latencies)*HEDGE_PERCENTILE//100)]
+        return self.hedge if self.hedge > 0 else None
+
+    def get_error_delay(self, attempt, error):
+        # returns the seconds to wait before retrying a request that failed
+        # with the error, or None if it shouldn't be retried
+        import aiohttp
+        if isinstance(error, aiohttp.ClientResponseError):
+            return self.get_status_delay(attempt, error.status, error.headers)
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)):
+            return self.get_delay(attempt)
+        return None
+
+    def get_status_delay(self, attempt, status, headers=None):
+        if status not in RETRY_STATUSES:
+            return None
+        return self.get_delay(attempt, get_retry_after(headers))
+
+    def get_delay(self, attempt, retry_after=None):
+        # the delay is random up to the backoff for the attempt so that the
+        # requests that failed together don't all retry together; a server
+        # asking for a longer wait than the limit isn't retried
+        if attempt >= self.retries:
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff*(2**attempt)))
+        if retry_after is not None:
+            if retry_after > self.max_backoff:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+class Attempt:
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.started.set()
+
+def get_retry_after(headers):
+    # returns the seconds to wait from a Retry-After header, which is either
+    # a number of seconds or a date
+    value = headers.get('Retry-After') if headers is not None else None
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None or date.tzinfo is None:
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+def create_policy_from_config(config):
+    # config keys: timeout=<seconds for a request>, connect_timeout=<seconds
+    # to connect>, read_timeout=<seconds between reads>, retries=<retries for
+    # a request>, backoff=<seconds before the first retry>,
+    # max_backoff=<longest wait before a retry>, hedge=<seconds before a
+    # duplicate request is started>|auto
+    hedge = str(config.get('hedge', DEFAULT_HEDGE)).strip().lower()
+    if hedge != HEDGE_AUTO:
+        hedge = float(hedge)
+    return RetryPolicy(
+        retries=int(config.get('retries', DEFAULT_RETRIES)),
+        backoff=float(config.get('backoff', DEFAULT_BACKOFF)),
+        max_backoff=float(config.get('max_backoff', DEFAULT_MAX_BACKOFF)),
+        hedge=hedge,
+        timeout=float(config.get('timeout', DEFAULT_TIMEOUT)),
+        connect_timeout=float(config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(config.get('read_timeout', DEFAULT_READ_TIMEOUT)))
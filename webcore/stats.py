@@ -0,0 +1,243 @@
+# opt-in instrumentation for the web functions; with the stats config key
+# set, each call records per-url timings for the phases of a fetch (waiting
+# for a request slot, dns, connect, first byte, download and parse), the
+# bytes transferred, cache and memo hits and the class of any error, along
+# with the time spent serializing the output, and emits them as a json
+# block when the call is done
+#
+# stats=stderr writes the block to stderr, stats=log logs it to the
+# webcore.stats logger and stats=file appends it as a line to the file at
+# WEBCORE_STATS_PATH; the path comes from the environment rather than the
+# config since the config is user input
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import contextlib
+import contextvars
+from collections import OrderedDict
+
+OUTPUT_STDERR = 'stderr'
+OUTPUT_LOG = 'log'
+OUTPUT_FILE = 'file'
+
+DEFAULT_STATS_PATH = os.path.join(tempfile.gettempdir(), 'flexio-web-stats.jsonl')
+
+PHASES = ['wait', 'dns', 'connect', 'first_byte', 'download', 'parse']
+
+# stats of the call and of the url being fetched by the current task
+current_stats = contextvars.ContextVar('current_stats', default=None)
+current_url = contextvars.ContextVar('current_url', default=None)
+
+class UrlStats:
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.bytes = 0
+        self.requests = 0
+        self.cache = None
+        self.memo = None
+        self.error = None
+        self.started = None
+        self.headers_received = None
+        self.parse_at_headers = 0.0 # parse time when the headers were received
+        self.times = dict.fromkeys(PHASES, 0.0)
+
+    def add_time(self, phase, start, end=None):
+        end = end if end is not None else time.perf_counter()
+        self.times[phase] = self.times[phase] + (end - start)
+
+    def fail(self, error):
+        self.error = type(error).__name__
+
+    def succeed(self):
+        # the errors of attempts that were retried or hedged don't count
+        # once an attempt succeeds
+        self.error = None
+
+    def to_dict(self):
+        result = OrderedDict()
+        result['url'] = self.url
+        result['status'] = self.status
+        result['bytes'] = self.bytes
+        result['requests'] = self.requests
+        result['cache'] = self.cache
+        result['memo'] = self.memo
+        result['error'] = self.error
+        for phase in PHASES:
+            result[phase] = to_ms(self.times[phase])
+        return result
+
+class Stats:
+
+    def __init__(self, output):
+        self.output = output
+        self.urls = OrderedDict()
+        self.start = time.perf_counter()
+        self.times = {'serialize': 0.0}
+
+    def get_url(self, url):
+        entry = self.urls.get(url)
+        if entry is None:
+            entry = UrlStats(url)
+            self.urls[url] = entry
+        return entry
+
+    def start_url(self, url):
+        # marks the url as the one being fetched by the current task; the
+        # response is assumed to come from the cache until a request is made
+        entry = self.get_url(url)
+        entry.started = time.perf_counter()
+        entry.headers_received = None
+        if entry.cache is None:
+            entry.cache = 'hit'
+        current_url.set(entry)
+        return entry
+
+    def finish_url(self, entry, size, status=None):
+        now = time.perf_counter()
+        entry.bytes = entry.bytes + size
+        if status is not None:
+            entry.status = status
+        if entry.headers_received is not None:
+            # a streamed body is parsed as it arrives; that time is
+            # recorded as parse time rather than download time
+            parse = entry.times['parse'] - entry.parse_at_headers
+            entry.add_time('download', entry.headers_received + parse, now)
+            entry.headers_received = None
+
+    def create_trace_config(self):
+        import aiohttp
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def to_dict(self):
+        urls = [entry.to_dict() for entry in self.urls.values()]
+        result = OrderedDict()
+        result['elapsed'] = to_ms(time.perf_counter() - self.start)
+        result['serialize'] = to_ms(self.times['serialize'])
+        result['count'] = len(urls)
+        result['bytes'] = sum(u['bytes'] for u in urls)
+        result['cache_hits'] = len([u for u in urls if u['cache'] in ('hit', 'revalidated')])
+        result['errors'] = len([u for u in urls if u['error'] is not None])
+        result['urls'] = urls
+        return result
+
+    def emit(self):
+        block = json.dumps({'stats': self.to_dict()})
+        if self.output == OUTPUT_STDERR:
+            sys.stderr.write(block + '\n')
+        elif self.output == OUTPUT_LOG:
+            logging.getLogger('webcore.stats').info(block)
+        elif self.output == OUTPUT_FILE:
+            with open(os.environ.get('WEBCORE_STATS_PATH', DEFAULT_STATS_PATH), 'a') as f:
+                f.write(block + '\n')
+
+# trace callbacks; the url stats come from the task making the request
+
+async def on_request_start(session, context, params):
+    entry = current_url.get()
+    if entry is None:
+        return
+    context.start = time.perf_counter()
+    entry.requests = entry.requests + 1
+    entry.cache = 'miss'
+    if entry.started is not None:
+        entry.add_time('wait', entry.started, context.start)
+        entry.started = None
+
+async def on_dns_resolvehost_start(session, context, params):
+    context.dns_start = time.perf_counter()
+
+async def on_dns_resolvehost_end(session, context, params):
+    entry = current_url.get()
+    if entry is not None and hasattr(context, 'dns_start'):
+        entry.add_time('dns', context.dns_start)
+
+async def on_connection_create_start(session, context, params):
+    context.connect_start = time.perf_counter()
+
+async def on_connection_create_end(session, context, params):
+    entry = current_url.get()
+    if entry is not None and hasattr(context, 'connect_start'):
+        entry.add_time('connect', context.connect_start)
+
+async def on_request_end(session, context, params):
+    entry = current_url.get()
+    if entry is None or not hasattr(context, 'start'):
+        return
+    entry.headers_received = time.perf_counter()
+    entry.parse_at_headers = entry.times['parse']
+    entry.add_time('first_byte', context.start, entry.headers_received)
+    entry.status = params.response.status
+    if params.response.status == 304:
+        entry.cache = 'revalidated'
+
+async def on_request_exception(session, context, params):
+    # a cancelled request is a hedged duplicate that lost, not an error
+    entry = current_url.get()
+    if entry is not None and not isinstance(params.exception, asyncio.CancelledError):
+        entry.fail(params.exception)
+
+def get_current():
+    return current_stats.get()
+
+@contextlib.contextmanager
+def phase(name):
+    # times a call-level phase, such as serializing the output
+    stats = current_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.times[name] = stats.times[name] + (time.perf_counter() - start)
+
+@contextlib.contextmanager
+def url_phase(name):
+    # times a phase of the url being fetched by the current task, for work
+    # that's done by the function rather than the engine, such as parsing
+    # a streamed body
+    entry = current_url.get()
+    if entry is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry.add_time(name, start)
+
+def to_ms(seconds):
+    return round(seconds*1000, 1)
+
+@contextlib.contextmanager
+def open_stats_from_config(config):
+    # config keys: stats=stderr|log|file
+    output = config.get('stats', '').strip()
+    if output == '':
+        yield None
+        return
+    if output not in (OUTPUT_STDERR, OUTPUT_LOG, OUTPUT_FILE):
+        raise ValueError
+    stats = Stats(output)
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+        stats.emit()
@@ -0,0 +1,78 @@
+# in-memory row storage for aggregating results; rows are kept as tuples in
+# memory and spilled to a temporary file in batches once the rows held by
+# all the stores sharing a budget grow beyond the budget's limit
+
+import sys
+import pickle
+import tempfile
+
+DEFAULT_MEMORY_LIMIT = 64 # megabytes
+
+class MemoryBudget:
+
+    def __init__(self, limit=DEFAULT_MEMORY_LIMIT*1024*1024):
+        self.limit = limit
+        self.used = 0
+
+class RowStore:
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.rows = []
+        self.size = 0
+        self.count = 0
+        self.spill_fp = None
+
+    def append(self, row):
+        self.rows.append(row)
+        self.count = self.count + 1
+        size = get_size(row)
+        self.size = self.size + size
+        self.budget.used = self.budget.used + size
+        if self.budget.used > self.budget.limit:
+            self.spill()
+
+    def spill(self):
+        if len(self.rows) == 0:
+            return
+        if self.spill_fp is None:
+            self.spill_fp = tempfile.TemporaryFile()
+        pickle.dump(self.rows, self.spill_fp, pickle.HIGHEST_PROTOCOL)
+        self.budget.used = self.budget.used - self.size
+        self.rows = []
+        self.size = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.spill_fp is not None:
+            self.spill_fp.seek(0)
+            while True:
+                try:
+                    rows = pickle.load(self.spill_fp)
+                except EOFError:
+                    break
+                yield from rows
+        yield from self.rows
+
+    def clear(self):
+        self.close()
+        self.count = 0
+
+    def close(self):
+        if self.spill_fp is not None:
+            self.spill_fp.close()
+            self.spill_fp = None
+        self.budget.used = self.budget.used - self.size
+        self.rows = []
+        self.size = 0
+
+def get_size(row):
+    # rough size of a row of strings; good enough for deciding when to spill
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+
+def create_budget_from_config(config):
+    # config keys: spill_size=<megabytes of rows kept in memory before
+    # spilling to disk>
+    return MemoryBudget(int(config.get('spill_size', DEFAULT_MEMORY_LIMIT))*1024*1024)
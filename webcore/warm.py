@@ -0,0 +1,62 @@
+# state kept across invocations when the functions run in a long-lived
+# worker; with WEBCORE_WARM=true, the event loop, the connection pool (with
+# its keep-alive connections and dns cache) and the parsing pools are
+# created on the first call and reused by the calls after it, so back-to-back
+# calls to the same hosts skip connection setup; everything is released
+# when the process exits
+
+import os
+import atexit
+import asyncio
+import inspect
+
+WARM = os.environ.get('WEBCORE_WARM', 'false').lower() == 'true'
+DNS_CACHE_TTL = 300 # seconds
+KEEPALIVE_TIMEOUT = 60 # seconds
+
+loop = None
+connector = None
+executors = {}
+
+def get_loop():
+    # without a warm worker, keep using the default loop like before
+    global loop
+    if not WARM:
+        return asyncio.get_event_loop()
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop
+
+def get_connector():
+    # the connector is shared by the sessions of all the calls; limits are
+    # enforced by each call's fetch scheduler, so the pool itself is
+    # unbounded; must be called from a coroutine running on the warm loop
+    global connector
+    import aiohttp
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    return connector
+
+def get_executor(key, factory):
+    executor = executors.get(key)
+    if executor is None:
+        executor = factory()
+        executors[key] = executor
+    return executor
+
+@atexit.register
+def close():
+    global connector
+    for executor in executors.values():
+        executor.shutdown(wait=False)
+    executors.clear()
+    if loop is None or loop.is_closed():
+        return
+    if connector is not None and not connector.closed:
+        result = connector.close()
+        if inspect.isawaitable(result):
+            loop.run_until_complete(result)
+        connector = None
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
@@ -0,0 +1,104 @@
+# json array output for the web functions; rows are positional lists that
+# are encoded in batches and written to the output in large chunks rather
+# than encoded and written one row at a time
+
+import json
+import decimal
+import datetime
+from webcore import stats
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_BATCH_SIZE = 1000 # rows encoded at a time
+DEFAULT_BUFFER_SIZE = 1024*1024 # characters buffered before writing to the output
+
+ENCODER_AUTO = 'auto'
+ENCODER_JSON = 'json'
+ENCODER_ORJSON = 'orjson'
+
+def encode_json(rows):
+    return json.dumps(rows, default=to_string)
+
+def encode_orjson(rows):
+    return orjson.dumps(rows, default=to_string).decode('utf-8')
+
+def to_string(value):
+    # values json can't encode natively, such as dates and decimals, are
+    # written as strings
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError
+
+def get_encoder(name=ENCODER_AUTO):
+    if name == ENCODER_AUTO:
+        name = ENCODER_ORJSON if orjson is not None else ENCODER_JSON
+    if name == ENCODER_ORJSON and orjson is not None:
+        return encode_orjson
+    if name == ENCODER_JSON:
+        return encode_json
+    raise ValueError
+
+class RowWriter:
+
+    def __init__(self, output, encoder=ENCODER_AUTO, batch_size=DEFAULT_BATCH_SIZE, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.output = output
+        self.encode = get_encoder(encoder)
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.chunks = ['[']
+        self.buffered = 1
+        self.count = 0 # rows written so far, including rows still being buffered
+
+    def write_row(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.encode_rows()
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.batch_size:
+            self.encode_rows()
+
+    def encode_rows(self):
+        if len(self.rows) == 0:
+            return
+        # encode the batch as an array and strip the brackets to get the
+        # comma-delimited rows
+        rows = self.rows
+        self.rows = []
+        with stats.phase('serialize'):
+            text = self.encode(rows)[1:-1]
+        self.append(text, len(rows))
+
+    def append(self, text, count):
+        if self.count > 0:
+            text = ',' + text
+        self.chunks.append(text)
+        self.buffered = self.buffered + len(text)
+        self.count = self.count + count
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.encode_rows()
+        if len(self.chunks) > 0:
+            with stats.phase('serialize'):
+                self.output.write(''.join(self.chunks))
+        self.chunks = []
+        self.buffered = 0
+
+    def close(self):
+        self.encode_rows()
+        self.chunks.append(']')
+        self.flush()
+
+def create_writer_from_config(output, config):
+    # config keys: encoder=auto|json|orjson
+    encoder = config.get('encoder', ENCODER_AUTO).lower().strip()
+    return RowWriter(output, encoder)